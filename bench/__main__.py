@@ -0,0 +1,215 @@
+"""
+Replays message traces against Turbo without connecting to Discord,
+with a local server standing in for the APIs, and reports throughput,
+latency and memory use
+
+Run from the repository root:
+    python -m bench                        # generated trace of 5000 messages
+    python -m bench bench/traces/mixed.jsonl
+    python -m bench --generate 20000 --save trace.jsonl
+"""
+
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from turbo.metrics import Histogram
+from . import trace
+from .fakes import BenchTurbo, FakeMessage
+from .stub import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'bench', 'fixtures')
+QUANTILES = (50, 95, 99)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Offline Turbo benchmark")
+    parser.add_argument('traces', nargs='*', help="JSON lines traces to replay, one after another")
+    parser.add_argument('--generate', type=int, default=5000, help="size of the generated trace without traces")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated trace")
+    parser.add_argument('--save', help="write the replayed trace to this file")
+    parser.add_argument('--repeat', type=int, default=1, help="replay the trace this many times")
+    parser.add_argument('--concurrency', type=int, default=1, help="messages handled at once")
+    parser.add_argument('--realtime', action='store_true', help="wait for the delays in the trace")
+    parser.add_argument('--api-latency', type=float, default=0, help="milliseconds the stub APIs take to respond")
+    parser.add_argument('--api-jitter', type=float, default=0, help="random extra milliseconds of API latency")
+    parser.add_argument('--tags', type=int, default=1000, help="amount of tags to create")
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--bot', action='store_true', help="run as a bot account instead of a selfbot")
+    parser.add_argument('--rate-limits', action='store_true', help="keep Discord's rate limits for sends and edits")
+    parser.add_argument('--log-level', default='warning')
+    parser.add_argument('--output', help="write every send, edit and delete to this JSON lines file")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary config directory")
+    return parser.parse_args()
+
+
+def prepare(workdir, args):
+    """
+    Creates a config directory from the examples and the bench fixtures
+    """
+    config_dir = os.path.join(workdir, 'config')
+    shutil.copytree(os.path.join(ROOT, 'config', 'examples'), config_dir)
+    shutil.copy(os.path.join(FIXTURES, 'responses.json'), config_dir)
+    tags = {'testtag': 'hello!'}
+    tags.update(('bench{}'.format(i), 'Benchmark tag number {}'.format(i)) for i in range(args.tags))
+    with open(os.path.join(config_dir, 'tags.json'), 'w', encoding='utf-8') as f:
+        json.dump(tags, f)
+
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(os.path.join(config_dir, 'config.ini'), encoding='utf-8')
+    options = {
+        ('Auth', 'Token'): 'bench',
+        ('Auth', 'Bot'): 'yes' if args.bot else 'no',
+        ('Options', 'Autorespond'): 'yes',
+        ('Holidays', 'Key'): 'bench',
+        ('Mashape', 'Key'): 'bench',
+        ('Steam', 'Key'): 'bench',
+        ('WeatherUnderground', 'Key'): 'bench',
+        ('Logging', 'Level'): args.log_level,
+        ('Storage', 'Backend'): args.storage,
+    }
+    for (section, option), value in options.items():
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
+    with open(os.path.join(config_dir, 'config.ini'), 'w', encoding='utf-8') as f:
+        config.write(f)
+
+
+def classify(bot, event):
+    if 'kind' in event:
+        return event['kind']
+    if event['content'].startswith(bot.config.prefix):
+        return 'command'
+    if event.get('channel', '100') in bot.responses:
+        return 'autoresponse'
+    return 'chatter'
+
+
+async def replay(bot, events, args, latencies):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    previous = {}
+    tasks = []
+
+    async def handle(message, kind):
+        start = time.perf_counter()
+        try:
+            # Same path as Turbo.dispatch, without scheduling a task
+            if bot.filter_message(message):
+                await bot.on_message(message)
+        finally:
+            latencies.setdefault(kind, Histogram()).record(time.perf_counter() - start)
+            semaphore.release()
+
+    for event in events:
+        if args.realtime and event.get('delay'):
+            await asyncio.sleep(event['delay'])
+        channel = bot.channel(event.get('channel', '100'), event.get('private', False))
+        author = bot.user if event.get('author') == 'self' else bot.other
+        content = event['content'].replace('{previous}', previous.get(channel.id, '0'))
+        message = FakeMessage(author, channel, content)
+        previous[channel.id] = message.id
+        await semaphore.acquire()
+        tasks.append(asyncio.ensure_future(handle(message, classify(bot, event))))
+    await asyncio.gather(*tasks)
+
+
+def format_table(title, stats):
+    """
+    Formats histograms keyed by name as a table in milliseconds
+    """
+    lines = ["{} (ms)".format(title)]
+    if not stats:
+        return lines + ["  none"]
+    width = max(max(len(name) for name in stats), 4)
+    lines.append("  {:<{}} {:>7} {:>6} {:>8} {:>8} {:>8} {:>8}".format(
+        'name', width, 'count', 'errors', 'p50', 'p95', 'p99', 'max'))
+    for name, (histogram, errors) in sorted(stats.items(), key=lambda i: i[1][0].count, reverse=True):
+        p50, p95, p99 = (histogram.percentile(q) * 1000 for q in QUANTILES)
+        lines.append("  {:<{}} {:>7} {:>6} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+            name, width, histogram.count, errors, p50, p95, p99, histogram.max * 1000))
+    return lines
+
+
+async def run(events, args):
+    server = StubServer(args.api_latency / 1000, args.api_jitter / 1000)
+    await server.start()
+    tracemalloc.start()
+    bot = BenchTurbo(server.url, record=bool(args.output), rate_limits=args.rate_limits)
+    await bot.start_offline()
+    startup_memory = tracemalloc.get_traced_memory()[0]
+    before = tracemalloc.take_snapshot()
+
+    latencies = {}
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        await replay(bot, events, args, latencies)
+    elapsed = time.perf_counter() - start
+
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    offenders = bot.watchdog.top(bot.config.watchdog_top)
+    await bot.close()
+    await server.stop()
+
+    handled = len(events) * args.repeat
+    lines = ["Replayed {} messages in {:.2f}s: {:.1f} messages/s".format(handled, elapsed, handled / elapsed), ""]
+    lines += format_table("Dispatch latency by message kind", {k: (h, 0) for k, h in latencies.items()})
+    lines += [""] + format_table("Command latency", {k: (s.latency, s.errors) for k, s in bot.metrics.commands.items()})
+    lines += [""] + format_table("API latency", {k: (s.latency, s.errors) for k, s in bot.metrics.requests.items()})
+    lines += ["", "Transport: {} sends, {} edits, {} deletes; stub APIs served {} requests".format(
+        bot.transport['send'], bot.transport['edit'], bot.transport['delete'], server.requests)]
+    for name, cache in sorted(bot.metrics.caches.items()):
+        lookups = cache.hits + cache.misses
+        lines.append("Cache {}: {:.1f}% hit rate ({} lookups)".format(
+            name, cache.hits / lookups * 100 if lookups else 0, lookups))
+    lines += ["", "Memory: {:.1f} KiB after startup, {:.1f} KiB after replay, {:.1f} KiB peak".format(
+        startup_memory / 1024, current / 1024, peak / 1024), "Largest growth during replay:"]
+    for stat in after.compare_to(before, 'lineno')[:10]:
+        lines.append("  {}".format(stat))
+    if offenders:
+        lines += ["", "Event loop blocked (worst first):"]
+        for offender in offenders:
+            lines.append("  {:.2f}s at {} {}".format(offender.worst, offender.site, offender.command or ''))
+    print('\n'.join(lines))
+
+    if args.output:
+        trace.save(args.output, bot.sent)
+
+
+def main():
+    args = parse_args()
+    if args.traces:
+        events = [event for file in args.traces for event in trace.load(file)]
+    else:
+        events = trace.generate(args.generate, args.seed, tags=args.tags)
+    if args.save:
+        trace.save(args.save, events)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix='turbo-bench-')
+    cwd = os.getcwd()
+    try:
+        prepare(workdir, args)
+        os.chdir(workdir)
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(run(events, args))
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print("Config kept in {}".format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
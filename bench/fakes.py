@@ -0,0 +1,177 @@
+import datetime
+import itertools
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from turbo import Turbo
+from turbo.http import HTTPClient, api_name
+
+DISCORD_EPOCH = 1420070400000
+
+_increment = itertools.count()
+
+
+def snowflake():
+    """
+    Creates a Discord ID for the current time, so that commands reading
+    the creation time of IDs get realistic values
+    """
+    return str(((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(_increment) & 0xFFF))
+
+
+class FakeUser:
+
+    def __init__(self, id, name, discriminator='0001', bot=False):
+        self.id = id
+        self.name = name
+        self.discriminator = discriminator
+        self.bot = bot
+        self.mention = '<@{}>'.format(id)
+        self.voice_channel = None
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return '{}#{}'.format(self.name, self.discriminator)
+
+
+class FakeServer:
+
+    def __init__(self, id, name, me):
+        self.id = id
+        self.name = name
+        self.me = me
+        self.members = {me.id: me}
+        self.channels = {}
+        self.emojis = []
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+
+    def __init__(self, id, server=None, user=None):
+        self.id = id
+        self.server = server
+        self.user = user
+        self.is_private = server is None
+        self.name = None if self.is_private else 'bench-{}'.format(id)
+        self.mention = '<#{}>'.format(id)
+        if server is not None:
+            server.channels[id] = self
+
+    def __str__(self):
+        return self.name or 'Direct Message with {}'.format(self.user)
+
+
+class FakeMessage:
+
+    def __init__(self, author, channel, content):
+        self.id = snowflake()
+        self.author = author
+        self.channel = channel
+        self.server = channel.server
+        self.content = content
+        self.clean_content = content
+        self.timestamp = datetime.datetime.utcnow()
+        self.edited_timestamp = None
+        self.raw_mentions = []
+        self.raw_channel_mentions = []
+        self.mentions = []
+        self.channel_mentions = []
+        self.role_mentions = []
+
+
+class StubHTTPClient(HTTPClient):
+    """
+    Sends every API request to the local stub server instead,
+    as /<api name>/<original path>
+    """
+
+    def __init__(self, base, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base
+
+    async def _fetch(self, session, url, params, headers):
+        parts = urlsplit(url)
+        url = '{}/{}/{}'.format(self.base, api_name(url) or 'unknown', parts.path.lstrip('/'))
+        if parts.query:
+            url += '?' + parts.query
+        return await super()._fetch(session, url, params, headers)
+
+
+class BenchTurbo(Turbo):
+    """
+    Turbo without a Discord connection
+    Sends, edits and deletes are counted (and optionally recorded) instead of made
+    """
+
+    def __init__(self, stub_url, record=False, rate_limits=False):
+        super().__init__()
+        self.transport = Counter()
+        self.sent = [] if record else None
+        self.http_client = StubHTTPClient(stub_url, timeout=self.config.http_timeout, timeouts=self.config.api_timeouts,
+                                          concurrency=self.config.http_concurrency,
+                                          connections_per_host=self.config.http_connections,
+                                          cache=self.http_client.cache, retries=self.config.http_retries,
+                                          breaker_threshold=self.config.breaker_threshold,
+                                          breaker_cooldown=self.config.breaker_cooldown)
+        if not rate_limits:
+            self.outbound.limits = {route: (10 ** 9, 1) for route in self.outbound.limits}
+
+        self.connection.user = FakeUser(snowflake(), 'Turbo', bot=self.config.bot)
+        self.other = FakeUser(snowflake(), 'Chatter')
+        self.fake_server = FakeServer(snowflake(), 'Bench', self.user)
+        self.fake_server.members[self.other.id] = self.other
+        self.fake_channels = {}
+
+    async def start_offline(self):
+        """
+        Marks the client as ready and runs on_ready as if it had logged in
+        """
+        self._is_ready.set()
+        await self.on_ready()
+
+    def channel(self, id, private=False):
+        channel = self.fake_channels.get((id, private))
+        if channel is None:
+            if private:
+                channel = FakeChannel(id, user=self.other)
+            else:
+                channel = FakeChannel(id, self.fake_server)
+            self.fake_channels[(id, private)] = channel
+        return channel
+
+    def _record(self, kind, channel, content):
+        self.transport[kind] += 1
+        if self.sent is not None:
+            self.sent.append({'kind': kind, 'channel': channel.id, 'content': content})
+
+    async def send_message(self, destination, content=None, *, tts=False, embed=None):
+        self._record('send', destination, content)
+        return FakeMessage(self.user, destination, content)
+
+    async def edit_message(self, message, new_content=None, *, embed=None):
+        self._record('edit', message.channel, new_content)
+        message.content = message.clean_content = new_content
+        message.edited_timestamp = datetime.datetime.utcnow()
+        return message
+
+    async def delete_message(self, message):
+        self._record('delete', message.channel, None)
+
+    async def delete_messages(self, messages):
+        for message in messages:
+            self._record('delete', message.channel, None)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import random
+import socket
+
+from aiohttp import web
+
+# Canned payloads with the fields the commands read, keyed by ApiBase name
+FIXTURES = {
+    'cat': {'file': 'http://random.cat/i/bench.jpg'},
+    'github': {'login': 'bench', 'name': 'Bench Mark', 'blog': 'https://example.com', 'location': 'Localhost',
+               'public_repos': 12, 'public_gists': 3, 'followers': 40, 'following': 2,
+               'html_url': 'https://github.com/bench'},
+    'names': {'name': 'Jane', 'surname': 'Doe', 'gender': 'female', 'region': 'United States'},
+    'holidays': {'holidays': [{'name': 'Bench Day', 'date': '2017-01-01', 'public': True},
+                              {'name': 'Profiling Day', 'date': '2017-01-02', 'public': False}]},
+    'overwatch': {'overall_stats': {'level': 52, 'wins': 120, 'losses': 98, 'games': 218, 'prestige': 1, 'comprank': 2650},
+                  'game_stats': {'kpd': 2.1, 'multikills': 40, 'final_blows': 3000, 'solo_kills_most_in_game': 12,
+                                 'healing_done_most_in_game': 9000, 'damage_done_most_in_game': 14000,
+                                 'multikill_best': 4}},
+    'steam': {'response': {'players': []}},
+    'weather': {'current_observation': {'display_location': {'full': 'Beverly Hills, CA'}, 'weather': 'Clear',
+                                        'UV': 3, 'temp_f': 72, 'feelslike_f': 72, 'wind_dir': 'West', 'wind_mph': 4}},
+    'quote': {'quote': 'Premature optimization is the root of all evil.', 'author': 'Donald Knuth'},
+    'joke': {'joke': 'There are 10 kinds of people.'},
+    'yomama': {'joke': 'Yo mama is so slow, she makes the benchmark look fast.'},
+    'urbandictionary': {'list': [{'definition': 'A repeatable measurement.'}]},
+}
+
+HEARTHSTONE_INFO = {'patch': '7.0.0.15590', 'classes': ['Druid', 'Hunter', 'Mage', 'Paladin', 'Priest', 'Rogue',
+                                                        'Shaman', 'Warlock', 'Warrior'],
+                    'sets': ['Basic', 'Classic', 'Naxxramas'], 'types': ['Minion', 'Spell', 'Weapon'],
+                    'factions': ['Alliance', 'Horde', 'Neutral'], 'races': ['Beast', 'Demon', 'Dragon', 'Murloc']}
+
+
+def hearthstone_cards(amount):
+    """
+    Builds a card dump shaped like the real one, which is several MB
+    """
+    sets = HEARTHSTONE_INFO['sets']
+    cards = {name: [] for name in sets}
+    for i in range(amount):
+        cards[sets[i % len(sets)]].append({'cardId': 'BENCH_{}'.format(i), 'name': 'Card {}'.format(i),
+                                           'type': 'Minion', 'cost': i % 10, 'text': 'Deal {} damage.'.format(i % 7)})
+    return cards
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for every ApiBase endpoint
+    Requests are rewritten to /<api name>/<original path> by the bench HTTP client
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, cards=3000):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.url = None
+        self._bodies = {api: json.dumps(payload).encode() for api, payload in FIXTURES.items()}
+        self._bodies['hearthstone/info'] = json.dumps(HEARTHSTONE_INFO).encode()
+        self._bodies['hearthstone/cards'] = json.dumps(hearthstone_cards(cards)).encode()
+        self._app = web.Application()
+        self._app.router.add_route('GET', '/{api}/{tail:.*}', self._handle)
+        self._runner = None
+        self._server = None
+        self._handler = None
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        api = request.match_info['api']
+        body = self._bodies.get(api)
+        if api == 'hearthstone':
+            body = self._bodies['hearthstone/cards' if request.match_info['tail'].endswith('cards') else 'hearthstone/info']
+        if body is None:
+            return web.Response(status=404)
+        return web.Response(body=body, content_type='application/json')
+
+    async def start(self, host='127.0.0.1'):
+        sock = socket.socket()
+        sock.bind((host, 0))
+        self.url = 'http://{}:{}'.format(*sock.getsockname())
+        if hasattr(web, 'AppRunner'):
+            self._runner = web.AppRunner(self._app)
+            await self._runner.setup()
+            await web.SockSite(self._runner, sock).start()
+        else:
+            self._handler = self._app.make_handler()
+            self._server = await asyncio.get_event_loop().create_server(self._handler, sock=sock)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        await self._handler.finish_connections()
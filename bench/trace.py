@@ -0,0 +1,83 @@
+"""
+Message traces are JSON lines with these keys:
+    content - the message text, with {previous} replaced by the ID
+              of the previous message in the same channel
+    author  - "self" for the bot's own account, anything else for another user
+    channel - channel ID, defaults to "100"
+    private - whether the channel is a direct message
+    delay   - seconds since the previous message, used with --realtime
+    kind    - label the dispatch latency is reported under,
+              guessed from the content when missing
+"""
+
+import json
+import random
+
+CHANNELS = ['100', '101', '102', '103', '104']
+
+CHATTER = [
+    "anyone around?", "that patch notes thread is wild", "i think the server is lagging again",
+    "who's up for a game later", "brb getting food", "did you see the new trailer",
+    "lmao", "ok", "that's not how any of this works", "can someone pin that",
+]
+
+TRIGGERS = {
+    '100': ["hello everyone", "good morning chat", "ping", "brb"],
+    '101': ["gg", "lol that was close", "what's the time"],
+}
+
+LOCAL_COMMANDS = [
+    "tag testtag", "tag bench{tag}", "tag benhc{tag}", "tags", "tags 2", "flip", "random 100",
+    "bold benchmark", "strike benchmark", "italics benchmark", "time", "date", "stats",
+    "echo {previous}", "msginfo {previous}", "responses", "listtimers",
+]
+
+API_COMMANDS = [
+    "cat", "joke", "yomama", "quote", "githubuser bench", "urbandictionary bench", "weather 90210",
+    "owplayer Bench#1234", "generatename", "generatename female", "hearthinfo", "holidays",
+]
+
+
+def load(file):
+    with open(file, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save(file, events):
+    with open(file, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+def _weighted(rng, options, weights):
+    point = rng.uniform(0, sum(weights))
+    for option, weight in zip(options, weights):
+        point -= weight
+        if point <= 0:
+            return option
+    return options[-1]
+
+
+def generate(amount, seed=0, prefix='$', tags=1000, mix=(60, 15, 20, 5)):
+    """
+    Creates a trace of chatter, autoresponse triggers, local commands and API commands
+    mixed by the given weights
+    """
+    rng = random.Random(seed)
+    kinds = ['chatter', 'autoresponse', 'command', 'api']
+    events = []
+    for _ in range(amount):
+        kind = _weighted(rng, kinds, mix)
+        if kind == 'chatter':
+            event = {'author': 'other', 'channel': rng.choice(CHANNELS), 'content': rng.choice(CHATTER)}
+        elif kind == 'autoresponse':
+            channel = rng.choice(list(TRIGGERS))
+            event = {'author': 'other', 'channel': channel, 'content': rng.choice(TRIGGERS[channel])}
+        else:
+            command = rng.choice(LOCAL_COMMANDS if kind == 'command' else API_COMMANDS)
+            event = {'author': 'self', 'channel': rng.choice(CHANNELS),
+                     'content': prefix + command.replace('{tag}', str(rng.randrange(tags)))}
+        event['kind'] = kind
+        event['delay'] = round(rng.expovariate(20), 4)
+        events.append(event)
+    return events
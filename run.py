@@ -3,19 +3,22 @@ import traceback
 from colorama import init, Fore
 init()
 
-print('\x1b[2J')
+# Eval sessions run in processes that import this module again,
+# so the bot must only start when it's run directly
+if __name__ == '__main__':
+    print('\x1b[2J')
 
-try:
-    from turbo import Turbo
-    bot = Turbo()
-    print("Starting...")
-    bot.run()
-except aiohttp.errors.ClientOSError as e:
-    print(Fore.RED + "Problem connecting to Discord: {}".format(e))
-except Exception as e:
-    if hasattr(e, '__module__') and e.__module__ == 'turbo.exceptions':
-        name = e.__class__.__name__
-        if name == "FatalError":
-            print("{}{}".format(Fore.RED, e.message))
-    else:
-        traceback.print_exc()
+    try:
+        from turbo import Turbo
+        bot = Turbo()
+        print("Starting...")
+        bot.run()
+    except aiohttp.errors.ClientOSError as e:
+        print(Fore.RED + "Problem connecting to Discord: {}".format(e))
+    except Exception as e:
+        if hasattr(e, '__module__') and e.__module__ == 'turbo.exceptions':
+            name = e.__class__.__name__
+            if name == "FatalError":
+                print("{}{}".format(Fore.RED, e.message))
+        else:
+            traceback.print_exc()
@@ -0,0 +1,327 @@
+import array
+import asyncio
+import bisect
+import datetime
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from .cache import MessageRecord
+
+log = logging.getLogger('turbo.archive')
+
+# Record length, ID, channel ID, author ID, timestamp and flags, followed by the lengths
+# of the channel name (or recipient), server name, author, content and clean content
+_RECORD = struct.Struct('<IQQQdBIIIII')
+# Index files start with a magic number and the amount of entries,
+# followed by all IDs in order and then the matching offsets
+_INDEX = struct.Struct('<4sI')
+_MAGIC = b'TIDX'
+
+_PRIVATE = 1
+_RECIPIENT = 2
+_SAME_CLEAN = 4
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _encode(record):
+    """
+    Packs a MessageRecord into bytes, raises ValueError for IDs that aren't snowflakes
+    """
+    flags = 0
+    if record.is_private:
+        flags |= _PRIVATE
+    if record.channel_name:
+        place = record.channel_name
+    else:
+        place = record.recipient or ''
+        flags |= _RECIPIENT
+    clean = record.clean_content or ''
+    if clean == record.content:
+        flags |= _SAME_CLEAN
+        clean = ''
+    strings = [s.encode('utf-8') for s in (place, record.server_name or '', record.author, record.content or '', clean)]
+    length = _RECORD.size + sum(map(len, strings))
+    timestamp = (record.timestamp - _EPOCH).total_seconds() if record.timestamp else 0.0
+    header = _RECORD.pack(length, int(record.id), int(record.channel_id), int(record.author_id),
+                          timestamp, flags, *map(len, strings))
+    return header + b''.join(strings)
+
+
+def _decode(data):
+    length, id, channel_id, author_id, timestamp, flags, *lengths = _RECORD.unpack_from(data)
+    strings = []
+    position = _RECORD.size
+    for size in lengths:
+        strings.append(bytes(data[position:position + size]).decode('utf-8', errors='replace'))
+        position += size
+    place, server, author, content, clean = strings
+    return MessageRecord.restore(
+        id=str(id), channel_id=str(channel_id), author_id=str(author_id), author=author, content=content,
+        channel_name=None if flags & _RECIPIENT else place, recipient=place if flags & _RECIPIENT else None,
+        server_name=None if flags & _PRIVATE else server, is_private=bool(flags & _PRIVATE),
+        clean_content=content if flags & _SAME_CLEAN else clean,
+        timestamp=_EPOCH + datetime.timedelta(seconds=timestamp))
+
+
+def _read(file, offset):
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        header = f.read(_RECORD.size)
+        length = _RECORD.unpack(header)[0]
+        return _decode(header + f.read(length - _RECORD.size))
+
+
+def _scan(file):
+    """
+    Returns the ID to offset entries of a segment without an index
+    A record cut off by a crash is truncated
+    """
+    entries = {}
+    with open(file, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _RECORD.size <= len(data):
+        length, id = _RECORD.unpack_from(data, offset)[:2]
+        if length < _RECORD.size or offset + length > len(data):
+            break
+        entries[id] = offset
+        offset += length
+    if offset < len(data):
+        log.warning("Truncating %s bytes of a damaged record from %s", len(data) - offset, file)
+        with open(file, 'r+b') as f:
+            f.truncate(offset)
+    return entries, offset
+
+
+def _write_index(file, entries):
+    ids = array.array('Q', sorted(entries))
+    offsets = array.array('I', (entries[id] for id in ids))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file) or '.', suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            f.write(_INDEX.pack(_MAGIC, len(ids)))
+            f.write(ids.tobytes())
+            f.write(offsets.tobytes())
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class _Segment:
+    """
+    One data file of the archive
+    The active segment keeps its entries in a dict, the others use their index file
+    """
+
+    def __init__(self, directory, seq):
+        self.seq = seq
+        self.data_file = os.path.join(directory, '{:08d}.seg'.format(seq))
+        self.index_file = os.path.join(directory, '{:08d}.idx'.format(seq))
+        self.size = 0
+        self.entries = {}
+        self.ids = None
+        self.offsets = None
+        self._file = None
+        self._map = None
+        self._view = None
+
+    def __len__(self):
+        return len(self.entries) if self.entries is not None else len(self.ids)
+
+    @property
+    def disk_size(self):
+        if self.entries is not None:
+            return self.size
+        return self.size + _INDEX.size + 12 * len(self.ids)
+
+    def locate(self, id):
+        if self.entries is not None:
+            return self.entries.get(id)
+        if not self.ids or not self.ids[0] <= id <= self.ids[-1]:
+            return None
+        i = bisect.bisect_left(self.ids, id)
+        if i < len(self.ids) and self.ids[i] == id:
+            return self.offsets[i]
+        return None
+
+    def open_index(self):
+        """
+        Memory-maps the index file, replacing the entries dict
+        """
+        self._file = open(self.index_file, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _INDEX.unpack_from(self._map)
+        if magic != _MAGIC or len(self._map) != _INDEX.size + 12 * count:
+            self.close()
+            raise ValueError("Invalid archive index: {}".format(self.index_file))
+        self._view = memoryview(self._map)
+        start = _INDEX.size
+        self.ids = self._view[start:start + 8 * count].cast('Q')
+        self.offsets = self._view[start + 8 * count:].cast('I')
+        self.entries = None
+
+    def close(self):
+        for view in (self.ids, self.offsets, self._view):
+            if view is not None:
+                view.release()
+        self.ids = self.offsets = self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+class MessageArchive:
+    """
+    Append-only archive of every message seen, kept in segment files on disk
+    Full segments get a sorted ID index that is memory-mapped for lookups,
+    and the oldest segments are deleted once the archive outgrows its maximum size
+    """
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_size=1024 * 1024 * 1024, flush_delay=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.flush_delay = flush_delay
+        self.hits = 0
+        self.misses = 0
+        self._segments = []
+        self._writer = None
+        self._handle = None
+        self._sealing = set()
+
+    def __len__(self):
+        return sum(len(segment) for segment in self._segments)
+
+    def load(self):
+        """
+        Opens the segments on disk and starts appending to a new one
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        seqs = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                      if name.endswith('.seg') and name[:-4].isdigit())
+        for seq in seqs:
+            segment = _Segment(self.directory, seq)
+            segment.size = os.path.getsize(segment.data_file)
+            try:
+                segment.open_index()
+            except (OSError, ValueError, struct.error):
+                # Left active when the bot stopped
+                segment.entries, segment.size = _scan(segment.data_file)
+                if not segment.entries:
+                    os.remove(segment.data_file)
+                    continue
+                _write_index(segment.index_file, segment.entries)
+                segment.open_index()
+            self._segments.append(segment)
+        self._start_segment(seqs[-1] + 1 if seqs else 0)
+        self._apply_retention()
+
+    def add(self, record):
+        """
+        Appends a MessageRecord, edited messages are added again
+        """
+        try:
+            data = _encode(record)
+        except (ValueError, TypeError):
+            return  # Not a real Discord message
+        active = self._segments[-1]
+        active.entries[int(record.id)] = active.size
+        self._writer.write(data)
+        active.size += len(data)
+        if active.size >= self.segment_size:
+            self._rotate()
+        elif self._handle is None:
+            self._handle = asyncio.get_event_loop().call_later(self.flush_delay, self._flush)
+
+    async def get(self, id):
+        """
+        Returns the newest archived copy of the message with the ID, if any
+        """
+        try:
+            key = int(id)
+        except ValueError:
+            key = None
+        for segment in reversed(self._segments):
+            offset = segment.locate(key) if key is not None else None
+            if offset is not None:
+                break
+        else:
+            self.misses += 1
+            return None
+        if segment is self._segments[-1]:
+            self._writer.flush()
+        try:
+            record = await asyncio.get_event_loop().run_in_executor(None, _read, segment.data_file, offset)
+        except (OSError, struct.error):
+            # Deleted by retention in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    async def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._sealing:
+            await asyncio.wait(self._sealing)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for segment in self._segments:
+            segment.close()
+
+    def _start_segment(self, seq):
+        segment = _Segment(self.directory, seq)
+        self._writer = open(segment.data_file, 'ab', buffering=64 * 1024)
+        self._segments.append(segment)
+
+    def _flush(self):
+        self._handle = None
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _rotate(self):
+        """
+        Seals the active segment and starts a new one
+        The sealed segment's index is written in the executor
+        """
+        self._writer.close()
+        sealed = self._segments[-1]
+        self._start_segment(sealed.seq + 1)
+        future = asyncio.ensure_future(asyncio.get_event_loop().run_in_executor(
+            None, _write_index, sealed.index_file, sealed.entries))
+        self._sealing.add(future)
+        future.add_done_callback(lambda f: self._sealed(sealed, f))
+
+    def _sealed(self, segment, future):
+        self._sealing.discard(future)
+        if future.cancelled() or future.exception() is not None:
+            log.error("Failed writing archive index %s: %s", segment.index_file,
+                      'cancelled' if future.cancelled() else future.exception())
+            return  # Lookups keep using the entries in memory
+        if segment in self._segments:
+            segment.open_index()
+        self._apply_retention()
+
+    def _apply_retention(self):
+        if not self.max_size:
+            return
+        total = sum(segment.disk_size for segment in self._segments)
+        # Only sealed segments are deleted, and never the active one
+        while total > self.max_size and len(self._segments) > 1 and self._segments[0].entries is None:
+            segment = self._segments.pop(0)
+            total -= segment.disk_size
+            segment.close()
+            for file in (segment.data_file, segment.index_file):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+            log.info("Deleted archive segment %s to stay under the maximum size", segment.seq)
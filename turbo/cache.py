@@ -0,0 +1,120 @@
+import re
+import time
+from collections import OrderedDict
+
+_EVERYONE = re.compile(r'@(everyone|here)')
+
+
+class MessageRecord:
+    """
+    Compact copy of the parts of a discord.Message used by commands
+    Only the names of mentions are kept, the clean content is made when it's first read
+    """
+    __slots__ = ('id', 'channel_id', 'channel_name', 'recipient', 'server_name', 'is_private',
+                 'author', 'author_id', 'content', 'mentions', 'timestamp', 'cached_at', '_clean')
+
+    def __init__(self, message):
+        channel = message.channel
+        self.id = message.id
+        self.channel_id = channel.id
+        self.channel_name = channel.name
+        self.recipient = None if channel.name else str(channel.user)
+        self.is_private = channel.is_private
+        self.server_name = None if channel.is_private else message.server.name
+        self.author = str(message.author)
+        self.author_id = message.author.id
+        self.content = message.content
+        self.mentions = None
+        if message.mentions or message.channel_mentions or message.role_mentions:
+            self.mentions = _mention_names(message)
+        self.timestamp = message.timestamp
+        self.cached_at = time.monotonic()
+        self._clean = None
+
+    @property
+    def clean_content(self):
+        """
+        The content with mentions replaced by names, like discord.Message.clean_content
+        """
+        if self._clean is None:
+            content = self.content or ''
+            if self.mentions:
+                pattern = re.compile('|'.join(map(re.escape, self.mentions)))
+                content = pattern.sub(lambda m: self.mentions[m.group(0)], content)
+            self._clean = _EVERYONE.sub('@\u200b\\1', content)
+        return self._clean
+
+    @classmethod
+    def restore(cls, **fields):
+        """
+        Recreates a record from stored fields
+        """
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, fields.get(name))
+        record._clean = fields.get('clean_content')
+        record.cached_at = time.monotonic()
+        return record
+
+
+def _mention_names(message):
+    names = {}
+    for channel in message.channel_mentions:
+        names['<#{}>'.format(channel.id)] = '#' + channel.name
+    for user in message.mentions:
+        name = '@' + getattr(user, 'display_name', user.name)
+        names['<@{}>'.format(user.id)] = name
+        names['<@!{}>'.format(user.id)] = name
+    if message.server is not None:
+        for role in message.role_mentions:
+            names['<@&{}>'.format(role.id)] = '@' + role.name
+    return names
+
+
+class MessageStore:
+    """
+    Message cache keyed by ID with least recently used eviction
+    and an optional time to live
+    """
+
+    def __init__(self, max_size, ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._messages = OrderedDict()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __contains__(self, id):
+        return id in self._messages
+
+    def add(self, message):
+        """
+        Caches a message, replacing any older copy of it
+        """
+        record = MessageRecord(message)
+        self._messages.pop(record.id, None)
+        self._messages[record.id] = record
+        while len(self._messages) > self.max_size:
+            self._messages.popitem(last=False)
+        return record
+
+    def get(self, id):
+        """
+        Returns the cached message with the ID, if any
+        """
+        record = self._messages.get(id)
+        if record is not None and self._expired(record):
+            del self._messages[id]
+            record = None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._messages.move_to_end(id)
+        return record
+
+    def _expired(self, record):
+        return self.ttl and time.monotonic() - record.cached_at > self.ttl
@@ -0,0 +1,78 @@
+import inspect
+
+# Arguments that are taken from the message rather than from the command's text
+_INJECTORS = {
+    'message': lambda message: message,
+    'channel': lambda message: message.channel,
+    'author': lambda message: message.author,
+    'server': lambda message: message.server,
+    'user_mentions': lambda message: list(map(message.server.get_member, message.raw_mentions)),
+    'channel_mentions': lambda message: list(map(message.server.get_channel, message.raw_channel_mentions)),
+    'voice_channel': lambda message: message.server.me.voice_channel,
+}
+
+
+class Command:
+    """
+    A cmd_* handler along with everything needed to call it,
+    worked out once instead of on every message
+    """
+    __slots__ = ('name', 'handler', 'inject', 'args', 'defaults', 'min_args', 'leftover', 'usage')
+
+    def __init__(self, name, handler, prefix):
+        self.name = name
+        self.handler = handler
+
+        params = inspect.signature(handler).parameters
+        self.inject = tuple((key, _INJECTORS[key]) for key in params if key in _INJECTORS)
+        self.leftover = 'leftover_args' in params
+
+        args = [(key, param.default) for key, param in params.items()
+                if key not in _INJECTORS and key != 'leftover_args']
+        self.args = tuple(key for key, _ in args)
+        self.defaults = {key: default for key, default in args if default is not inspect.Parameter.empty}
+
+        # Arguments are consumed in order, so everything up to the last
+        # argument without a default has to be given
+        self.min_args = 0
+        for i, key in enumerate(self.args):
+            if key not in self.defaults:
+                self.min_args = i + 1
+
+        usage = [prefix + name]
+        for key in self.args:
+            if key in self.defaults:
+                usage.append('[{}={}]'.format(key, self.defaults[key]))
+            else:
+                usage.append(key)
+        if self.leftover:
+            usage.append('...')
+        self.usage = ' '.join(usage)
+
+    def bind(self, message, args):
+        """
+        Builds the keyword arguments for the handler
+        Returns None if not enough arguments were given
+        """
+        if len(args) < self.min_args:
+            return None
+        kwargs = {key: inject(message) for key, inject in self.inject}
+        kwargs.update(zip(self.args, args))
+        if self.leftover:
+            kwargs['leftover_args'] = args[len(self.args):]
+        return kwargs
+
+
+def build_commands(client, prefix):
+    """
+    Finds every cmd_* handler on the client and returns them keyed by name
+    """
+    commands = {}
+    for attr in dir(client):
+        if not attr.startswith('cmd_'):
+            continue
+        handler = getattr(client, attr)
+        if callable(handler):
+            name = attr[len('cmd_'):]
+            commands[name] = Command(name, handler, prefix)
+    return commands
@@ -3,6 +3,7 @@ import os
 import shutil
 
 from .exceptions import FatalError, printError
+from .utils import ApiBase
 from colorama import Fore
 
 
@@ -38,6 +39,8 @@ class Config:
             'Options', 'Prefix', fallback=ConfigDefaults.prefix)
         self.messages = config.getint(
             'Options', 'Messages', fallback=ConfigDefaults.messages)
+        self.message_ttl = config.getint(
+            'Options', 'MessageTTL', fallback=ConfigDefaults.message_ttl)
         self.flip = config.get(
             'Options', 'Flip', fallback=ConfigDefaults.flip)
         self.autorespond = config.getboolean(
@@ -62,6 +65,80 @@ class Config:
         self.weather_key = config.get(
             'WeatherUnderground', 'Key')
 
+        self.log_level = config.get(
+            'Logging', 'Level', fallback=ConfigDefaults.log_level)
+        self.log_file = config.get(
+            'Logging', 'File', fallback=ConfigDefaults.log_file)
+        self.log_max_bytes = config.getint(
+            'Logging', 'MaxBytes', fallback=ConfigDefaults.log_max_bytes)
+        self.log_backups = config.getint(
+            'Logging', 'Backups', fallback=ConfigDefaults.log_backups)
+        self.log_levels = {}
+        if config.has_section('Logging'):
+            self.log_levels = {k: v for k, v in config.items('Logging')
+                               if k not in ['level', 'file', 'maxbytes', 'backups']}
+
+        self.metrics_file = config.get(
+            'Metrics', 'PrometheusFile', fallback=ConfigDefaults.metrics_file)
+        self.metrics_interval = config.getint(
+            'Metrics', 'Interval', fallback=ConfigDefaults.metrics_interval)
+
+        self.eval_timeout = config.getfloat(
+            'Eval', 'Timeout', fallback=ConfigDefaults.eval_timeout)
+        self.eval_memory = config.getint(
+            'Eval', 'MemoryLimit', fallback=ConfigDefaults.eval_memory)
+
+        self.watchdog_threshold = config.getfloat(
+            'Watchdog', 'Threshold', fallback=ConfigDefaults.watchdog_threshold)
+        self.watchdog_top = config.getint(
+            'Watchdog', 'Top', fallback=ConfigDefaults.watchdog_top)
+
+        self.archive = config.getboolean(
+            'Archive', 'Enabled', fallback=ConfigDefaults.archive)
+        self.archive_directory = config.get(
+            'Archive', 'Directory', fallback=ConfigDefaults.archive_directory)
+        self.archive_segment_size = config.getint(
+            'Archive', 'SegmentSize', fallback=ConfigDefaults.archive_segment_size)
+        self.archive_max_size = config.getint(
+            'Archive', 'MaxSize', fallback=ConfigDefaults.archive_max_size)
+
+        self.search = config.getboolean(
+            'Search', 'Enabled', fallback=ConfigDefaults.search)
+        self.search_max = config.getint(
+            'Search', 'MaxMessages', fallback=ConfigDefaults.search_max)
+
+        self.storage = config.get(
+            'Storage', 'Backend', fallback=ConfigDefaults.storage)
+        self.database = config.get(
+            'Storage', 'Database', fallback=ConfigDefaults.database)
+
+        self.http_timeout = config.getfloat(
+            'HTTP', 'Timeout', fallback=ConfigDefaults.http_timeout)
+        self.http_concurrency = config.getint(
+            'HTTP', 'Concurrency', fallback=ConfigDefaults.http_concurrency)
+        self.http_connections = config.getint(
+            'HTTP', 'ConnectionsPerHost', fallback=ConfigDefaults.http_connections)
+        self.http_retries = config.getint(
+            'HTTP', 'Retries', fallback=ConfigDefaults.http_retries)
+        self.breaker_threshold = config.getint(
+            'HTTP', 'BreakerThreshold', fallback=ConfigDefaults.breaker_threshold)
+        self.breaker_cooldown = config.getfloat(
+            'HTTP', 'BreakerCooldown', fallback=ConfigDefaults.breaker_cooldown)
+
+        self.api_timeouts = {}
+        if config.has_section('Timeouts'):
+            self.api_timeouts = dict(config.items('Timeouts'))
+
+        self.cache_size = config.getint(
+            'Cache', 'Size', fallback=ConfigDefaults.cache_size)
+        self.cache_ttls = dict(ConfigDefaults.cache_ttls)
+        if config.has_section('Cache'):
+            self.cache_ttls.update((k, v) for k, v in config.items('Cache') if k != 'size')
+
+        self.pool_sizes = dict(ConfigDefaults.pool_sizes)
+        if config.has_section('Pools'):
+            self.pool_sizes.update(config.items('Pools'))
+
         self.validate()
 
     def validate(self):
@@ -79,11 +156,116 @@ class Config:
             print("{}Messages amount in config must be 100 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.messages, Fore.RESET))
             self.messages = ConfigDefaults.messages
 
+        if self.message_ttl < 0:
+            print("{}Message TTL in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.message_ttl, Fore.RESET))
+            self.message_ttl = ConfigDefaults.message_ttl
+
+        self.log_level = self.handle_log_level(self.log_level, 'default')
+        self.log_levels = {k: self.handle_log_level(v, k) for k, v in self.log_levels.items()}
+
+        if self.metrics_interval < 1:
+            print("{}Metrics interval in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.metrics_interval, Fore.RESET))
+            self.metrics_interval = ConfigDefaults.metrics_interval
+
+        if self.eval_timeout <= 0:
+            print("{}Eval timeout in config must be higher than 0. Defaulting to {}{}".format(self.color, ConfigDefaults.eval_timeout, Fore.RESET))
+            self.eval_timeout = ConfigDefaults.eval_timeout
+
+        if self.eval_memory < 0:
+            print("{}Eval memory limit in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.eval_memory, Fore.RESET))
+            self.eval_memory = ConfigDefaults.eval_memory
+
+        if self.watchdog_threshold < 0:
+            print("{}Watchdog threshold in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.watchdog_threshold, Fore.RESET))
+            self.watchdog_threshold = ConfigDefaults.watchdog_threshold
+
+        if self.watchdog_top < 1:
+            print("{}Watchdog top in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.watchdog_top, Fore.RESET))
+            self.watchdog_top = ConfigDefaults.watchdog_top
+
+        if not 1 <= self.archive_segment_size <= 1024:
+            print("{}Archive segment size in config must be between 1 and 1024. Defaulting to {}{}".format(self.color, ConfigDefaults.archive_segment_size, Fore.RESET))
+            self.archive_segment_size = ConfigDefaults.archive_segment_size
+        if self.archive_max_size < 0:
+            print("{}Archive maximum size in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.archive_max_size, Fore.RESET))
+            self.archive_max_size = ConfigDefaults.archive_max_size
+
+        if self.search_max < 1:
+            print("{}Search maximum messages in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.search_max, Fore.RESET))
+            self.search_max = ConfigDefaults.search_max
+
+        self.storage = self.storage.lower()
+        if self.storage not in ['json', 'sqlite']:
+            print("{}Unknown storage backend: {}. Defaulting to {}{}".format(self.color, self.storage, ConfigDefaults.storage, Fore.RESET))
+            self.storage = ConfigDefaults.storage
+
+        if self.http_concurrency < 1:
+            print("{}HTTP concurrency in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.http_concurrency, Fore.RESET))
+            self.http_concurrency = ConfigDefaults.http_concurrency
+        if self.http_connections < 1:
+            print("{}HTTP connections per host in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.http_connections, Fore.RESET))
+            self.http_connections = ConfigDefaults.http_connections
+        if self.http_retries < 0:
+            print("{}HTTP retries in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.http_retries, Fore.RESET))
+            self.http_retries = ConfigDefaults.http_retries
+        if self.breaker_threshold < 1:
+            print("{}Breaker threshold in config must be 1 or higher. Defaulting to {}{}".format(self.color, ConfigDefaults.breaker_threshold, Fore.RESET))
+            self.breaker_threshold = ConfigDefaults.breaker_threshold
+        if self.breaker_cooldown < 0:
+            print("{}Breaker cooldown in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.breaker_cooldown, Fore.RESET))
+            self.breaker_cooldown = ConfigDefaults.breaker_cooldown
+
+        self.api_timeouts = self.handle_api_values(self.api_timeouts, 'timeout')
+
+        if self.cache_size < 0:
+            print("{}Cache size in config can't be negative. Defaulting to {}{}".format(self.color, ConfigDefaults.cache_size, Fore.RESET))
+            self.cache_size = ConfigDefaults.cache_size
+        self.cache_ttls = self.handle_api_values(self.cache_ttls, 'cache TTL')
+
+        for pool, size in list(self.pool_sizes.items()):
+            if pool not in ConfigDefaults.pool_sizes:
+                print("{}Unknown pool in config: {}{}".format(self.color, pool, Fore.RESET))
+                del self.pool_sizes[pool]
+                continue
+            try:
+                self.pool_sizes[pool] = int(size)
+                if self.pool_sizes[pool] < 0:
+                    raise ValueError
+            except ValueError:
+                print("{}Invalid size for pool {}: {}. Defaulting to {}{}".format(self.color, pool, size, ConfigDefaults.pool_sizes[pool], Fore.RESET))
+                self.pool_sizes[pool] = ConfigDefaults.pool_sizes[pool]
+
         if self.flip:
             self.flip = self.handle_comma_list(self.flip)
         if self.moderator:
             self.moderator = self.handle_comma_list(self.moderator)
 
+    def handle_log_level(self, level, name):
+        """
+        Utility function for handling logging level names
+        """
+        level = level.upper()
+        if level not in ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']:
+            print("{}Invalid {} logging level: {}. Defaulting to {}{}".format(self.color, name, level, ConfigDefaults.log_level, Fore.RESET))
+            return ConfigDefaults.log_level
+        return level
+
+    def handle_api_values(self, data, name):
+        """
+        Utility function for handling per-API numbers
+        Drops unknown APIs and values that aren't numbers
+        """
+        values = {}
+        for api, value in data.items():
+            if not hasattr(ApiBase, api):
+                print("{}Unknown API in {} config: {}{}".format(self.color, name, api, Fore.RESET))
+                continue
+            try:
+                values[api] = float(value)
+            except ValueError:
+                print("{}Invalid {} for API {}: {}{}".format(self.color, name, api, value, Fore.RESET))
+        return values
+
     def handle_comma_list(self, data):
         """
         Utility function for handling comma seperated lists
@@ -102,6 +284,7 @@ class ConfigDefaults:
 
     prefix = '$'
     messages = 5000
+    message_ttl = 0
     flip = "Heads, Tails"
     autorespond = False
     color = "YELLOW"
@@ -112,3 +295,54 @@ class ConfigDefaults:
     holidays_country = "US"
 
     mashape = None
+
+    log_level = "INFO"
+    log_file = None
+    log_max_bytes = 5000000
+    log_backups = 3
+
+    metrics_file = None
+    metrics_interval = 60
+
+    eval_timeout = 10
+    eval_memory = 256
+
+    watchdog_threshold = 0.5
+    watchdog_top = 10
+
+    archive = False
+    archive_directory = "config/archive"
+    archive_segment_size = 16
+    archive_max_size = 1024
+
+    search = False
+    search_max = 500000
+
+    storage = "json"
+    database = "config/turbo.db"
+
+    http_timeout = 10.0
+    http_concurrency = 8
+    http_connections = 4
+    http_retries = 2
+    breaker_threshold = 5
+    breaker_cooldown = 30.0
+
+    cache_size = 256
+    # Random APIs (cat, joke, quote, ...) are left out on purpose
+    cache_ttls = {
+        'holidays': 21600,
+        'github': 300,
+        'hearthstone': 3600,
+        'overwatch': 300,
+        'steam': 60,
+        'weather': 300,
+        'urbandictionary': 3600,
+    }
+
+    pool_sizes = {
+        'cat': 5,
+        'joke': 5,
+        'yomama': 5,
+        'quote': 5,
+    }
@@ -1,4 +1,4 @@
-from colorama import Fore
+import logging
 
 
 class TurboException(Exception):
@@ -11,6 +11,14 @@ class TurboException(Exception):
         return self._message
 
 
+class RequestError(TurboException):
+    pass
+
+
+class QueryError(TurboException):
+    pass
+
+
 class FatalError(TurboException):
 
     def __init__(self, issue):
@@ -22,4 +30,4 @@ class FatalError(TurboException):
 
 
 def printError(error):
-    print(Fore.RED + "{}".format(error) + Fore.RESET)
+    logging.getLogger('turbo').error(error)
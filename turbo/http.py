@@ -0,0 +1,319 @@
+import asyncio
+import email.utils
+import inspect
+import json
+import logging
+import math
+import random
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .exceptions import RequestError
+from .utils import ApiBase
+
+log = logging.getLogger('turbo.http')
+
+# Longest base first so that overlapping bases resolve to the most specific API
+_API_BASES = sorted(((name, base) for name, base in vars(ApiBase).items() if not name.startswith('_')),
+                    key=lambda i: len(i[1]), reverse=True)
+
+
+def api_name(url):
+    """
+    Returns the name of the ApiBase entry a URL belongs to
+    """
+    for name, base in _API_BASES:
+        if url.startswith(base):
+            return name
+    return None
+
+
+class Response:
+    """
+    Fully read response of a HTTP request
+    Mirrors the parts of requests.Response used by the commands
+    """
+    __slots__ = ('url', 'status_code', 'headers', 'content')
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+
+class ResponseCache:
+    """
+    Least recently used cache of successful responses
+    Each API has its own time to live, APIs without one aren't cached
+    """
+
+    def __init__(self, ttls=None, max_size=256):
+        self.ttls = ttls or {}
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, api):
+        return self.ttls.get(api, 0)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, api, response):
+        ttl = self.ttl(api)
+        if not ttl or response.status_code != 200:
+            return
+        self._entries[key] = (time.monotonic() + ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def retry_after(response):
+    """
+    Returns the seconds a response asks to wait with Retry-After, if any
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.mktime_tz(email.utils.parsedate_tz(value)) - time.time(), 0.0)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Tracks the failures of a host
+    After enough failures in a row the circuit opens, and requests fail
+    straight away until the cooldown is over. One trial request is then
+    let through, which closes the circuit again if it succeeds
+    A wait the host asks for with Retry-After is kept apart from the circuit
+    """
+    __slots__ = ('threshold', 'cooldown', 'failures', 'open_until', 'retry_at', 'trial')
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = None
+        self.retry_at = 0
+        self.trial = False
+
+    @property
+    def waiting(self):
+        return self.open_until is not None or self.retry_at > time.monotonic()
+
+    def remaining(self):
+        """
+        Returns the seconds until the circuit lets a request through again
+        """
+        until = max(self.open_until or 0, self.retry_at)
+        return max(until - time.monotonic(), 0)
+
+    def allow(self):
+        now = time.monotonic()
+        if now < self.retry_at:
+            return False
+        if self.open_until is None:
+            return True
+        if self.trial or now < self.open_until:
+            return False
+        self.trial = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.open_until = None
+        self.trial = False
+
+    def failure(self, wait=None):
+        self.failures += 1
+        if self.trial or self.failures >= self.threshold:
+            self.open_until = time.monotonic() + self.cooldown
+        if wait:
+            self.retry_at = max(self.retry_at, time.monotonic() + wait)
+        self.trial = False
+
+    def abandon(self):
+        """
+        Ends a trial request that was cancelled or failed without saying anything about the host
+        """
+        self.trial = False
+
+
+class HTTPClient:
+    """
+    Asynchronous HTTP client used for all external API calls
+    Keeps one keep-alive connection pool per host and
+    bounds the amount of requests in flight at once
+    """
+
+    def __init__(self, timeout=10, timeouts=None, concurrency=8, connections_per_host=4, cache=None,
+                 retries=2, backoff=0.5, max_backoff=5, breaker_threshold=5, breaker_cooldown=30):
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.connections_per_host = connections_per_host
+        self.cache = cache if cache is not None else ResponseCache()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._sessions = {}
+        self._pending = {}
+        self._breakers = {}
+
+    def open_circuits(self):
+        """
+        Returns the hosts that requests currently fail fast for,
+        with the seconds until they are tried again
+        """
+        return sorted((host, breaker.remaining()) for host, breaker in self._breakers.items()
+                      if breaker.waiting)
+
+    def _session(self, host):
+        """
+        Returns the pooled session for a host, creating it when needed
+        """
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections_per_host)
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[host] = session
+        return session
+
+    async def _fetch(self, session, url, params, headers):
+        async with session.get(url, params=params, headers=headers) as r:
+            content = await r.read()
+            return Response(str(r.url), r.status, dict(r.headers), content)
+
+    async def get(self, url, params=None, headers=None, timeout=None, cache=True):
+        """
+        Makes a GET request and returns the fully read Response
+        Responses of APIs with a cache TTL are cached unless cache is False,
+        and identical requests made while one is in progress share its result
+        Raises RequestError if the request fails or times out
+        """
+        api = api_name(url)
+        if timeout is None:
+            timeout = self.timeouts.get(api, self.timeout)
+        if headers:
+            # requests silently dropped unset headers, aiohttp doesn't
+            headers = {k: v for k, v in headers.items() if v is not None}
+        if not cache or not self.cache.ttl(api):
+            return await self._request(url, params, headers, timeout)
+
+        key = (url, tuple(sorted(params.items())) if params else None,
+               tuple(sorted(headers.items())) if headers else None)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._request(url, params, headers, timeout))
+            future.add_done_callback(lambda f: self._finish(key, api, f))
+            self._pending[key] = future
+        # Shielded so one caller giving up doesn't cancel the request for the others
+        return await asyncio.shield(future)
+
+    def _finish(self, key, api, future):
+        del self._pending[key]
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, api, future.result())
+
+    async def _request(self, url, params, headers, timeout):
+        """
+        Makes a request, retrying failures with jittered exponential backoff
+        Only GET requests are made, so retrying them is safe
+        Fails fast while the host's circuit is open
+        """
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise RequestError("{} is unavailable, trying again in {} seconds".format(host, math.ceil(breaker.remaining())))
+            trial = breaker.trial
+            try:
+                response = await self._attempt(host, url, params, headers, timeout)
+            except RequestError as e:
+                breaker.failure()
+                error, wait = e, None
+            except BaseException:
+                # Cancelled or failed unexpectedly, so another request becomes the trial
+                if trial:
+                    breaker.abandon()
+                raise
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    breaker.success()
+                    return response
+                wait = retry_after(response)
+                breaker.failure(wait)
+                error = None
+            if wait is None:
+                wait = random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+            if attempt >= self.retries or wait > self.max_backoff:
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            log.debug("Retrying %s in %.2f seconds (attempt %s)", host, wait, attempt)
+            await asyncio.sleep(wait)
+
+    async def _attempt(self, host, url, params, headers, timeout):
+        log.debug("Requesting %s from %s", api_name(url), host)
+        session = self._session(host)
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._fetch(session, url, params, headers), timeout)
+            except asyncio.TimeoutError:
+                raise RequestError("Request to {} timed out after {} seconds".format(host, timeout))
+            except (aiohttp.ClientError, OSError) as e:
+                raise RequestError("Request to {} failed: {}".format(host, e))
+
+    async def close(self):
+        """
+        Closes every pooled session
+        """
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            result = session.close()
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,164 @@
+import bisect
+
+
+class MemberIndex:
+    """
+    Index of visible members by ID and by discriminator
+    Kept up to date from gateway events instead of scanning every server
+    """
+
+    def __init__(self):
+        self._members = {}
+        self._discrims = {}
+        self._discrim_of = {}
+
+    def __len__(self):
+        return len(self._members)
+
+    def rebuild(self, servers):
+        """
+        Rebuilds the whole index from the given servers
+        """
+        self._members.clear()
+        self._discrims.clear()
+        self._discrim_of.clear()
+        for server in servers:
+            self.add_server(server)
+
+    def add_server(self, server):
+        for member in server.members:
+            self.add(member)
+
+    def remove_server(self, server):
+        for member in list(server.members):
+            self._remove(member.id, server.id)
+
+    def add(self, member):
+        """
+        Adds a member, or replaces it if it's already known for its server
+        """
+        self._members.setdefault(member.id, {})[member.server.id] = member
+        old = self._discrim_of.get(member.id)
+        if old is not None and old != member.discriminator:
+            self._unlink(old, member.id)
+        self._discrim_of[member.id] = member.discriminator
+        self._discrims.setdefault(member.discriminator, {})[member.id] = member
+
+    def remove(self, member):
+        self._remove(member.id, member.server.id)
+
+    def _remove(self, user_id, server_id):
+        servers = self._members.get(user_id)
+        if servers is None:
+            return
+        servers.pop(server_id, None)
+        discrim = self._discrim_of[user_id]
+        if servers:
+            # Still visible through another server
+            self._discrims[discrim][user_id] = next(iter(servers.values()))
+        else:
+            del self._members[user_id]
+            del self._discrim_of[user_id]
+            self._unlink(discrim, user_id)
+
+    def _unlink(self, discrim, user_id):
+        members = self._discrims.get(discrim)
+        if members is not None:
+            members.pop(user_id, None)
+            if not members:
+                del self._discrims[discrim]
+
+    def get(self, user_id):
+        """
+        Returns a member with the ID from any server, if visible
+        """
+        servers = self._members.get(user_id)
+        if not servers:
+            return None
+        return next(iter(servers.values()))
+
+    def with_discriminator(self, discrim):
+        """
+        Returns one member for every user with the discriminator
+        """
+        return list(self._discrims.get(discrim, {}).values())
+
+
+class EmojiIndex:
+    """
+    Index of custom emojis across servers by name
+    Supports exact, case-insensitive and prefix lookups
+    """
+
+    def __init__(self):
+        self._servers = {}
+        self._names = {}
+        self._lower = {}
+        self._sorted = None
+
+    def rebuild(self, servers):
+        """
+        Rebuilds the whole index from the given servers
+        """
+        self._servers.clear()
+        self._names.clear()
+        self._lower.clear()
+        self._sorted = None
+        for server in servers:
+            self.add_server(server)
+
+    def add_server(self, server):
+        """
+        Adds the emojis of a server, replacing any that were indexed before
+        """
+        self.remove_server(server)
+        emojis = list(server.emojis)
+        self._servers[server.id] = (server, emojis)
+        for emoji in emojis:
+            self._names.setdefault(emoji.name, []).append((server, emoji))
+            self._lower.setdefault(emoji.name.lower(), set()).add(emoji.name)
+        self._sorted = None
+
+    def remove_server(self, server):
+        entry = self._servers.pop(server.id, None)
+        if entry is None:
+            return
+        for emoji in entry[1]:
+            matches = self._names.get(emoji.name)
+            if matches is None:
+                continue
+            matches[:] = [m for m in matches if m[0].id != server.id]
+            if not matches:
+                del self._names[emoji.name]
+                names = self._lower[emoji.name.lower()]
+                names.discard(emoji.name)
+                if not names:
+                    del self._lower[emoji.name.lower()]
+        self._sorted = None
+
+    def get(self, name, ignore_case=False):
+        """
+        Returns (server, emoji) pairs for every emoji with the name
+        """
+        if not ignore_case:
+            return list(self._names.get(name, ()))
+        matches = []
+        for n in sorted(self._lower.get(name.lower(), ())):
+            matches.extend(self._names[n])
+        return matches
+
+    def prefix(self, prefix, limit=None):
+        """
+        Returns the names of emojis starting with the prefix, ignoring case
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self._lower)
+        prefix = prefix.lower()
+        names = []
+        for lower in self._sorted[bisect.bisect_left(self._sorted, prefix):]:
+            if not lower.startswith(prefix):
+                break
+            names.extend(sorted(self._lower[lower]))
+            if limit is not None and len(names) >= limit:
+                return names[:limit]
+        return names
@@ -0,0 +1,85 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from colorama import Fore
+
+
+def extra(color=None, prefix=None, **fields):
+    """
+    Builds the extra argument for a log call
+    The prefix is shown in color before the message on the console,
+    fields are only written to the log file
+    """
+    return {'color': color, 'prefix': prefix, 'fields': fields}
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Formats records the way Turbo has always printed them
+    """
+    level_colors = {logging.WARNING: Fore.YELLOW, logging.ERROR: Fore.RED, logging.CRITICAL: Fore.RED}
+
+    def format(self, record):
+        message = super().format(record)
+        color = getattr(record, 'color', None) or self.level_colors.get(record.levelno)
+        prefix = getattr(record, 'prefix', None)
+        if prefix:
+            return "{}{} {}{}".format(color or '', prefix, Fore.RESET, message)
+        if color:
+            return "{}{}{}".format(color, message, Fore.RESET)
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line
+    """
+
+    def format(self, record):
+        data = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': super().format(record),
+        }
+        prefix = getattr(record, 'prefix', None)
+        if prefix:
+            data['prefix'] = prefix
+        data.update(getattr(record, 'fields', None) or {})
+        return json.dumps(data, ensure_ascii=False)
+
+
+def setup_logging(config):
+    """
+    Sends the turbo loggers through a queue to a background thread,
+    which writes to the console and optionally a rotating JSON lines file
+    Returns the listener, which has to be stopped on shutdown
+    """
+    handlers = []
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(ConsoleFormatter())
+    handlers.append(console)
+    if config.log_file:
+        directory = os.path.dirname(config.log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file = logging.handlers.RotatingFileHandler(
+            config.log_file, maxBytes=config.log_max_bytes, backupCount=config.log_backups, encoding='utf-8')
+        file.setFormatter(JsonFormatter())
+        handlers.append(file)
+
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+
+    logger = logging.getLogger('turbo')
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(config.log_level)
+    logger.propagate = False
+    for name, level in config.log_levels.items():
+        logging.getLogger('turbo.{}'.format(name)).setLevel(level)
+    return listener
@@ -0,0 +1,102 @@
+from collections import deque
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton that finds every trigger
+    contained in a piece of text in a single pass
+    """
+    __slots__ = ('patterns', '_goto', '_fail', '_out', '_initial', '_all')
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        goto = [{}]
+        out = [0]
+        self._initial = 0
+        for i, pattern in enumerate(self.patterns):
+            if not pattern:
+                # An empty trigger is contained in everything
+                self._initial |= 1 << i
+                continue
+            state = 0
+            for char in pattern:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    out.append(0)
+                state = nxt
+            out[state] |= 1 << i
+
+        # Breadth-first so that every fail target is finished before it's used
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(char, 0)
+                out[nxt] |= out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._all = (1 << len(self.patterns)) - 1
+
+    def match(self, text):
+        """
+        Returns the triggers found in the text, in the order they were given
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = self._initial
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+                if found == self._all:
+                    break
+        return [p for i, p in enumerate(self.patterns) if found >> i & 1] if found else []
+
+
+class ResponseMatcher:
+    """
+    Keeps an automaton for every channel with autoresponses
+    Only channels whose triggers changed are rebuilt on update
+    """
+
+    def __init__(self):
+        self._channels = {}
+
+    def update(self, responses):
+        """
+        Syncs the automatons with the loaded autoresponses
+        """
+        channels = {}
+        for channel, triggers in responses.items():
+            triggers = tuple(triggers)
+            automaton = self._channels.get(channel)
+            if automaton is None or automaton.patterns != triggers:
+                automaton = Automaton(triggers)
+            channels[channel] = automaton
+        self._channels = channels
+
+    def match(self, channel, text):
+        """
+        Returns the triggers of a channel found in the text
+        """
+        automaton = self._channels.get(channel)
+        if automaton is None:
+            return []
+        return automaton.match(text)
+
+    def __contains__(self, channel):
+        return channel in self._channels
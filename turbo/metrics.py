@@ -0,0 +1,160 @@
+import asyncio
+import math
+import time
+
+from .exceptions import printError
+from .storage import write_atomic
+
+
+class Histogram:
+    """
+    Fixed memory histogram with logarithmic buckets
+    Buckets grow by 10% from 0.1ms up to about 100 seconds,
+    so percentiles are accurate to within 10%
+    """
+    low = 0.0001
+    growth = 1.1
+    size = 147
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (self.size + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value <= self.low:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.low, self.growth)) + 1, self.size)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the percentile
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.low * self.growth ** index, self.max)
+        return self.max
+
+
+class Stat:
+    """
+    Calls, errors and latency of a command or API
+    """
+    __slots__ = ('errors', 'latency')
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+
+    @property
+    def count(self):
+        return self.latency.count
+
+
+class Metrics:
+    """
+    Collects command, API and event loop statistics
+    """
+    quantiles = (50, 95, 99)
+
+    def __init__(self, prometheus_file=None, interval=60):
+        self.prometheus_file = prometheus_file
+        self.interval = interval
+        self.started = time.time()
+        self.commands = {}
+        self.requests = {}
+        self.loop_lag = Histogram()
+        self.caches = {}
+        self._tasks = []
+
+    def record_command(self, name, seconds, error=False):
+        self._record(self.commands, name, seconds, error)
+
+    def record_request(self, api, seconds, error=False):
+        self._record(self.requests, api, seconds, error)
+
+    def _record(self, stats, name, seconds, error):
+        stat = stats.get(name)
+        if stat is None:
+            stat = stats[name] = Stat()
+        stat.latency.record(seconds)
+        if error:
+            stat.errors += 1
+
+    def start(self):
+        """
+        Starts measuring event loop lag and writing the Prometheus file
+        """
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.ensure_future(self._watch_loop()))
+        if self.prometheus_file:
+            self._tasks.append(asyncio.ensure_future(self._write_prometheus()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _watch_loop(self, interval=0.5):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.loop_lag.record(max(time.monotonic() - start - interval, 0))
+
+    async def _write_prometheus(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, write_atomic, self.prometheus_file, self.prometheus())
+            except OSError as e:
+                printError("Failed writing metrics to {}: {}".format(self.prometheus_file, e))
+
+    def prometheus(self):
+        """
+        Returns every metric in the Prometheus text format
+        """
+        lines = []
+        for kind, label, stats in (('command', 'command', self.commands), ('request', 'api', self.requests)):
+            lines.append('# TYPE turbo_{}_latency_seconds summary'.format(kind))
+            for name, stat in sorted(stats.items()):
+                labels = '{}="{}"'.format(label, name)
+                for q in self.quantiles:
+                    lines.append('turbo_{}_latency_seconds{{{},quantile="{}"}} {}'.format(
+                        kind, labels, q / 100, stat.latency.percentile(q)))
+                lines.append('turbo_{}_latency_seconds_sum{{{}}} {}'.format(kind, labels, stat.latency.total))
+                lines.append('turbo_{}_latency_seconds_count{{{}}} {}'.format(kind, labels, stat.count))
+            lines.append('# TYPE turbo_{}_errors_total counter'.format(kind))
+            for name, stat in sorted(stats.items()):
+                lines.append('turbo_{}_errors_total{{{}="{}"}} {}'.format(kind, label, name, stat.errors))
+
+        lines.append('# TYPE turbo_loop_lag_seconds summary')
+        for q in self.quantiles:
+            lines.append('turbo_loop_lag_seconds{{quantile="{}"}} {}'.format(q / 100, self.loop_lag.percentile(q)))
+        lines.append('turbo_loop_lag_seconds_sum {}'.format(self.loop_lag.total))
+        lines.append('turbo_loop_lag_seconds_count {}'.format(self.loop_lag.count))
+
+        lines.append('# TYPE turbo_cache_hits_total counter')
+        for name, cache in sorted(self.caches.items()):
+            lines.append('turbo_cache_hits_total{{cache="{}"}} {}'.format(name, cache.hits))
+        lines.append('# TYPE turbo_cache_misses_total counter')
+        for name, cache in sorted(self.caches.items()):
+            lines.append('turbo_cache_misses_total{{cache="{}"}} {}'.format(name, cache.misses))
+        lines.append('# TYPE turbo_uptime_seconds gauge')
+        lines.append('turbo_uptime_seconds {}'.format(time.time() - self.started))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import deque
+
+# Longest message Discord accepts
+MESSAGE_LIMIT = 2000
+
+
+class RateLimit:
+    """
+    Token bucket allowing an amount of calls per period
+    """
+
+    def __init__(self, calls, period):
+        self.calls = calls
+        self.period = period
+        self._tokens = calls
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """
+        Takes a token and returns 0 if one is available,
+        otherwise returns the amount of seconds until one is
+        """
+        now = time.monotonic()
+        self._tokens = min(self.calls, self._tokens + (now - self._updated) * self.calls / self.period)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) * self.period / self.calls
+
+    def until_full(self):
+        """
+        Returns the amount of seconds until no calls count against the limit anymore
+        """
+        elapsed = time.monotonic() - self._updated
+        return max(self.calls - self._tokens - elapsed * self.calls / self.period, 0) * self.period / self.calls
+
+
+class _Operation:
+    __slots__ = ('route', 'target', 'content', 'delete_after', 'coalesce', 'futures')
+
+    def __init__(self, route, target, content, delete_after, coalesce):
+        self.route = route
+        self.target = target
+        self.content = content
+        self.delete_after = delete_after
+        self.coalesce = coalesce
+        self.futures = [asyncio.Future()]
+
+
+class OutboundQueue:
+    """
+    Queues outgoing messages per channel so that Discord's rate limits are respected
+    Sends and edits have separate queues and limits, so one waiting doesn't hold up the other
+    Consecutive sends marked to coalesce are merged into one message when they fit,
+    and repeated edits of a message only send the latest content
+    """
+
+    def __init__(self, send, edit, limits=None):
+        self._send = send
+        self._edit = edit
+        self.limits = limits or {'send': (5, 5), 'edit': (5, 5)}
+        self._queues = {}
+        self._workers = {}
+        self._buckets = {}
+        self._edits = {}
+
+    def __len__(self):
+        return sum(len(q) for q in self._queues.values())
+
+    async def send(self, dest, content, delete_after=0, coalesce=False):
+        """
+        Queues a message to be sent and returns it once it is
+        """
+        op = _Operation('send', dest, content, delete_after, coalesce)
+        self._enqueue(('send', dest.id), op)
+        return await op.futures[0]
+
+    async def edit(self, message, content, delete_after=0):
+        """
+        Queues a message to be edited and returns it once it is
+        """
+        op = self._edits.get(message.id)
+        if op is not None:
+            # Still waiting, so only the latest content needs sending
+            op.content = content
+            op.delete_after = delete_after
+            future = asyncio.Future()
+            op.futures.append(future)
+            return await future
+        op = _Operation('edit', message, content, delete_after, False)
+        self._edits[message.id] = op
+        self._enqueue(('edit', message.channel.id), op)
+        return await op.futures[0]
+
+    def _enqueue(self, key, op):
+        self._queues.setdefault(key, deque()).append(op)
+        if key not in self._workers:
+            self._workers[key] = asyncio.ensure_future(self._run(key))
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = RateLimit(*self.limits[key[0]])
+        return bucket
+
+    def _drop_bucket(self, key):
+        """
+        Forgets the bucket of an idle queue once it has refilled
+        Until then a new worker has to keep using it
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None or key in self._workers:
+            return
+        delay = bucket.until_full()
+        if delay:
+            asyncio.get_event_loop().call_later(delay, self._drop_bucket, key)
+        else:
+            del self._buckets[key]
+
+    async def _run(self, key):
+        queue = self._queues[key]
+        bucket = self._bucket(key)
+        try:
+            while queue:
+                delay = bucket.acquire()
+                while delay:
+                    await asyncio.sleep(delay)
+                    delay = bucket.acquire()
+
+                op = queue.popleft()
+                if op.route == 'edit':
+                    self._edits.pop(op.target.id, None)
+                elif op.coalesce:
+                    self._merge(op, queue)
+
+                try:
+                    if op.route == 'edit':
+                        result = await self._edit(op.target, op.content, op.delete_after)
+                    else:
+                        result = await self._send(op.target, op.content, op.delete_after)
+                except Exception as e:
+                    for future in op.futures:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for future in op.futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del self._workers[key]
+            if not queue:
+                del self._queues[key]
+            asyncio.get_event_loop().call_later(bucket.until_full(), self._drop_bucket, key)
+
+    def _merge(self, op, queue):
+        """
+        Merges the sends following an operation into it while they fit in one message
+        """
+        while queue:
+            nxt = queue[0]
+            if (not nxt.coalesce or nxt.delete_after != op.delete_after
+                    or len(op.content) + 1 + len(nxt.content) > MESSAGE_LIMIT):
+                break
+            queue.popleft()
+            op.content += '\n' + nxt.content
+            op.futures.extend(nxt.futures)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+log = logging.getLogger('turbo.pool')
+
+
+class ContentPool:
+    """
+    Keeps a buffer of ready items from an endpoint that returns something random
+    A background task tops it up when it drops below the low-water mark,
+    and items are only fetched live when the buffer is empty
+    """
+
+    def __init__(self, name, fetch, size, low=None, retry=30):
+        self.name = name
+        self.fetch = fetch
+        self.size = size
+        self.low = low if low is not None else max(size // 2, 1)
+        self.retry = retry
+        self.items = deque()
+        self.hits = 0
+        self.misses = 0
+        self._task = None
+        self._retry_at = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def start(self):
+        self._refill()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def get(self):
+        """
+        Returns a buffered item, or fetches one when there are none left
+        """
+        if self.items:
+            self.hits += 1
+            item = self.items.popleft()
+            self._refill()
+            return item
+        self.misses += 1
+        self._refill()
+        return await self.fetch()
+
+    def _refill(self):
+        if not self.size or len(self.items) >= self.low or time.monotonic() < self._retry_at:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._fill())
+
+    async def _fill(self):
+        # One request at a time, so the buffer never floods the API
+        while len(self.items) < self.size:
+            try:
+                item = await self.fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._retry_at = time.monotonic() + self.retry
+                log.warning("Couldn't fill the %s pool, retrying in %s seconds: %s", self.name, self.retry, e)
+                return
+            self.items.append(item)
@@ -0,0 +1,43 @@
+class Prefilter:
+    """
+    Decides in a few constant time checks whether on_message has anything
+    to do with a message, so that chatter is dropped before a coroutine is made for it
+    Built from the config and the bot's state, and rebuilt when that state changes
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.enable_command = "{}enable".format(prefix)
+        self.disable_command = "{}disable".format(prefix)
+        self.ready = False
+        self.disabled = False
+        self.user_id = None
+        self.commands_from_anyone = False
+        self.moderators = frozenset()
+        self.blacklist = frozenset()
+        self.channels = frozenset()
+
+    def rebuild(self, client):
+        user = client.user
+        self.user_id = user.id if user else None
+        self.commands_from_anyone = bool(user and user.bot)
+        self.moderators = frozenset(client.config.moderator)
+        self.blacklist = frozenset(client.blacklist)
+        self.channels = frozenset(client.responses) if client.config.autorespond else frozenset()
+        self.disabled = client.disabled
+
+    def wants(self, message):
+        author = message.author.id
+        if self.disabled:
+            return author == self.user_id and message.content == self.enable_command
+        if author in self.blacklist:
+            return False
+        if author == self.user_id:
+            return True
+        if author in self.moderators and message.content == self.disable_command:
+            return True
+        channel = message.channel
+        if channel.id in self.channels and not channel.is_private:
+            return True
+        # Bot accounts take commands from everyone
+        return self.commands_from_anyone and message.content.lstrip().startswith(self.prefix)
@@ -0,0 +1,48 @@
+import ast
+import hashlib
+from collections import OrderedDict
+
+
+class Repl:
+    """
+    Keeps the compiled code of recently evaluated sources
+    Code is parsed once: a trailing expression is evaluated for its value
+    and everything before it is executed
+    """
+
+    def __init__(self, cache_size=128):
+        self.cache_size = cache_size
+        self._code = OrderedDict()
+
+    def compile(self, source):
+        """
+        Returns the (statements, expression) code objects of a source
+        Either can be None, and SyntaxError is raised for invalid code
+        """
+        key = hashlib.sha1(source.encode('utf-8')).digest()
+        code = self._code.get(key)
+        if code is not None:
+            self._code.move_to_end(key)
+            return code
+        module = ast.parse(source, '<eval>', 'exec')
+        expression = None
+        if module.body and isinstance(module.body[-1], ast.Expr):
+            expression = compile(ast.Expression(module.body.pop().value), '<eval>', 'eval')
+        statements = compile(module, '<eval>', 'exec') if module.body else None
+        code = self._code[key] = (statements, expression)
+        if len(self._code) > self.cache_size:
+            self._code.popitem(last=False)
+        return code
+
+    def run(self, scope, code, **names):
+        """
+        Runs compiled code in a scope and returns the value of its trailing expression
+        The names are set in the scope first
+        """
+        statements, expression = code
+        scope.update(names)
+        if statements is not None:
+            exec(statements, scope)
+        if expression is None:
+            return None
+        return eval(expression, scope)
@@ -0,0 +1,436 @@
+import asyncio
+import inspect
+import io
+import logging
+import multiprocessing
+import os
+import reprlib
+import signal
+import sys
+import time
+import traceback
+
+from .repl import Repl
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows, so limits are only on wall time there
+
+log = logging.getLogger('turbo.eval')
+
+# Values of these types are sent between the bot and eval processes as they are,
+# anything else stays in the bot and is used through a Remote
+_PLAIN = (type(None), bool, int, float, complex, str, bytes)
+_CONTAINERS = (list, tuple, set, frozenset)
+# Handles of objects every session has
+_CLIENT = 0
+_MESSAGE = 1
+
+
+def _address_space():
+    """
+    Returns the virtual memory size of the process in bytes, or None where it can't be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGESIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def _describe(value):
+    try:
+        return reprlib.repr(value)
+    except Exception:
+        return '<{} object>'.format(type(value).__name__)
+
+
+class _Handle:
+    """
+    Reference to an object that lives in the bot, as sent to eval processes
+    """
+    __slots__ = ('id', 'text')
+
+    def __init__(self, id, text):
+        self.id = id
+        self.text = text
+
+    def __getstate__(self):
+        return self.id, self.text
+
+    def __setstate__(self, state):
+        self.id, self.text = state
+
+
+class RemoteError(Exception):
+    """
+    Raised in evaluated code when something done through a Remote fails in the bot
+    """
+
+
+class Remote:
+    """
+    Stands in for an object of the bot in evaluated code
+    Attribute lookups, calls and items are sent to the bot, calls returning
+    a coroutine are awaited on its event loop, and plain values come back as they are
+    """
+    __slots__ = ('_channel', '_id', '_text')
+
+    def __init__(self, channel, id, text):
+        object.__setattr__(self, '_channel', channel)
+        object.__setattr__(self, '_id', id)
+        object.__setattr__(self, '_text', text)
+
+    def __getattr__(self, name):
+        return self._channel.request('getattr', self._id, name)
+
+    def __setattr__(self, name, value):
+        self._channel.request('setattr', self._id, name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._channel.request('call', self._id, args, kwargs)
+
+    def __getitem__(self, key):
+        return self._channel.request('getitem', self._id, key)
+
+    def __iter__(self):
+        return iter(self._channel.request('iter', self._id))
+
+    def __len__(self):
+        return self._channel.request('len', self._id)
+
+    def __str__(self):
+        return self._channel.request('str', self._id)
+
+    def __repr__(self):
+        return self._text
+
+
+class _Channel:
+    """
+    The eval process' end of the connection to the bot
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def request(self, op, id, *args):
+        self.conn.send(('request', op, id) + tuple(self.export(arg) for arg in args))
+        kind, payload = self.conn.recv()
+        if kind == 'error':
+            raise RemoteError(payload)
+        return self.wrap(payload)
+
+    def export(self, value):
+        if isinstance(value, Remote):
+            return _Handle(value._id, value._text)
+        if type(value) in _CONTAINERS:
+            return type(value)(self.export(v) for v in value)
+        if type(value) is dict:
+            return {self.export(k): self.export(v) for k, v in value.items()}
+        return value
+
+    def wrap(self, value):
+        if isinstance(value, _Handle):
+            return Remote(self, value.id, value.text)
+        if type(value) in _CONTAINERS:
+            return type(value)(self.wrap(v) for v in value)
+        if type(value) is dict:
+            return {self.wrap(k): self.wrap(v) for k, v in value.items()}
+        return value
+
+
+class _Output:
+    """
+    Stand-in for sys.stdout in eval processes, which sends what's written
+    to the bot at most every interval
+    """
+
+    def __init__(self, conn, interval=0.5):
+        self.conn = conn
+        self.interval = interval
+        self.parts = []
+        self.sent = time.monotonic()
+
+    def write(self, text):
+        self.parts.append(text)
+        if time.monotonic() - self.sent >= self.interval:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.parts:
+            self.conn.send(('output', ''.join(self.parts)))
+            self.parts = []
+        self.sent = time.monotonic()
+
+
+def _limit_cpu(seconds):
+    """
+    Lets the process use the CPU for seconds more before it's killed with SIGXCPU
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker(conn, memory_limit, cache_size):
+    """
+    Main function of an eval process, which runs the code of one session
+    """
+    import discord
+    # Stopping is up to the bot
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_limit:
+        size = _address_space()
+        if size is not None:
+            hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+            resource.setrlimit(resource.RLIMIT_AS, (size + memory_limit, hard))
+    channel = _Channel(conn)
+    repl = Repl(cache_size)
+    loop = asyncio.new_event_loop()
+    scope = {'self': Remote(channel, _CLIENT, '<client>'), 'discord': discord, 'asyncio': asyncio}
+    while True:
+        try:
+            source, timeout, message = conn.recv()
+        except (EOFError, OSError):
+            return
+        conn.send(('started',))
+        if resource is not None:
+            _limit_cpu(timeout)
+        output = sys.stdout = _Output(conn)
+        value = error = None
+        # Globals are only changed by code that finishes, functions
+        # defined earlier keep using the same dictionary though
+        saved = dict(scope)
+        try:
+            code = repl.compile(source)
+            value = repl.run(scope, code, message=Remote(channel, _MESSAGE, message))
+            if inspect.isawaitable(value):
+                value = loop.run_until_complete(value)
+            if code[1] is not None:
+                scope['_'] = value
+        except SyntaxError:
+            error = traceback.format_exc(limit=0)
+        except BaseException:
+            error = traceback.format_exc()
+            scope.clear()
+            scope.update(saved)
+        finally:
+            sys.stdout = sys.__stdout__
+            del saved
+        output.flush()
+        conn.send(('done', None if value is None else _describe(value), error, len(scope)))
+
+
+class Result:
+    """
+    Outcome of sandboxed code
+    value is the repr of the value, and error the formatted traceback or reason it was stopped, if any
+    """
+    __slots__ = ('value', 'error', 'output', 'elapsed')
+
+    def __init__(self):
+        self.value = None
+        self.error = None
+        self.output = ''
+        self.elapsed = 0.0
+
+
+class Session:
+    """
+    Eval session with its own process, whose globals persist between evaluations
+    Objects of the bot handed to the process are kept in handles until the session ends
+    """
+    __slots__ = ('name', 'runs', 'variables', 'process', 'conn', 'handles')
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.variables = 0
+        self.process = None
+        self.conn = None
+        self.handles = {}
+
+
+class Sandbox:
+    """
+    Runs evaluated code in one process per session, so that it can't block the bot
+    A process is killed when its code runs longer than the timeout. Where the
+    resource module is available it's also limited in CPU time, and in memory
+    to the memory limit on top of what it uses when it starts
+    """
+
+    def __init__(self, client, timeout=10, memory_limit=0, poll=0.02, startup=60, cache_size=128):
+        self.client = client
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.poll = poll
+        self.startup = startup
+        self.cache_size = cache_size
+        self.sessions = {}
+        self._context = multiprocessing.get_context('spawn')
+
+    def session(self, name):
+        """
+        Returns the session with the name, creating it when needed
+        Its process is started by the first evaluation
+        """
+        session = self.sessions.get(name)
+        if session is None:
+            session = self.sessions[name] = Session(name)
+        return session
+
+    def remove(self, name):
+        session = self.sessions.pop(name, None)
+        if session is None:
+            return False
+        self._stop(session)
+        return True
+
+    def close(self):
+        for session in self.sessions.values():
+            self._stop(session)
+
+    async def run(self, session, source, message, progress=None, interval=1.0):
+        """
+        Runs code in a session's process and returns a Result
+        progress is called with the output so far while the code runs
+        """
+        if session.process is None or not session.process.is_alive():
+            self._start(session)
+        session.handles[_MESSAGE] = message
+        result = Result()
+        output = io.StringIO()
+        requested = time.monotonic()
+        start = deadline = None
+        reason = None
+        shown = 0
+        last_progress = requested
+        session.conn.send((source, self.timeout, _describe(message)))
+
+        while True:
+            try:
+                ready = session.conn.poll()
+                if ready:
+                    kind, *payload = session.conn.recv()
+            except (EOFError, OSError):
+                ready, kind = True, 'exited'
+            if ready:
+                if kind == 'started':
+                    start = time.monotonic()
+                    deadline = start + self.timeout
+                elif kind == 'output':
+                    output.write(payload[0])
+                elif kind == 'request':
+                    session.conn.send(await self._perform(session, payload, deadline))
+                elif kind == 'done':
+                    result.value, result.error, session.variables = payload
+                    session.runs += 1
+                    break
+                else:
+                    reason = self._exit_reason(session)
+                    break
+                continue
+            now = time.monotonic()
+            if not session.process.is_alive():
+                reason = self._exit_reason(session)
+                break
+            if deadline is not None and now > deadline:
+                reason = "Timed out after {} seconds".format(self.timeout)
+                break
+            if deadline is None and now - requested > self.startup:
+                reason = "The eval process didn't start"
+                break
+            if progress is not None and now - last_progress >= interval and output.tell() != shown:
+                shown = output.tell()
+                last_progress = now
+                await progress(output.getvalue())
+            await asyncio.sleep(self.poll)
+
+        if reason is not None:
+            self._stop(session)
+            result.error = "{}, the session was reset".format(reason)
+        result.output = output.getvalue()
+        result.elapsed = time.monotonic() - (start or requested)
+        return result
+
+    def _start(self, session):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker, args=(child, self.memory_limit, self.cache_size),
+                                        name='turbo-eval-{}'.format(session.name), daemon=True)
+        process.start()
+        child.close()
+        session.process = process
+        session.conn = parent
+        session.handles = {_CLIENT: self.client}
+        session.variables = 0
+
+    def _stop(self, session):
+        if session.process is not None:
+            if session.process.is_alive():
+                session.process.terminate()
+            session.conn.close()
+        session.process = session.conn = None
+        session.handles = {}
+
+    def _exit_reason(self, session):
+        session.process.join(1)
+        code = session.process.exitcode
+        if resource is not None and code == -signal.SIGXCPU:
+            return "Used more than {} seconds of CPU time".format(self.timeout)
+        return "The eval process exited with code {}".format(code)
+
+    async def _perform(self, session, request, deadline):
+        """
+        Does what a Remote asked for with an object of the bot
+        """
+        op, id, *args = request
+        try:
+            target = session.handles[id]
+            if op == 'getattr':
+                value = getattr(target, args[0])
+            elif op == 'setattr':
+                value = setattr(target, args[0], self._import(session, args[1]))
+            elif op == 'call':
+                value = target(*self._import(session, args[0]), **self._import(session, args[1]))
+            elif op == 'getitem':
+                value = target[self._import(session, args[0])]
+            elif op == 'iter':
+                value = list(target)
+            elif op == 'len':
+                value = len(target)
+            else:
+                value = str(target)
+            if inspect.isawaitable(value):
+                remaining = max(deadline - time.monotonic(), 0.001) if deadline is not None else self.timeout
+                value = await asyncio.wait_for(value, remaining)
+            return 'value', self._export(session, value)
+        except Exception as e:
+            return 'error', '{}: {}'.format(type(e).__name__, e)
+
+    def _export(self, session, value, depth=0):
+        if type(value) in _PLAIN:
+            return value
+        if depth < 3 and type(value) in _CONTAINERS:
+            return type(value)(self._export(session, v, depth + 1) for v in value)
+        if depth < 3 and type(value) is dict:
+            return {self._export(session, k, depth + 1): self._export(session, v, depth + 1) for k, v in value.items()}
+        id = len(session.handles)
+        while id in session.handles:
+            id += 1
+        session.handles[id] = value
+        return _Handle(id, _describe(value))
+
+    def _import(self, session, value):
+        if isinstance(value, _Handle):
+            return session.handles[value.id]
+        if type(value) in _CONTAINERS:
+            return type(value)(self._import(session, v) for v in value)
+        if type(value) is dict:
+            return {self._import(session, k): self._import(session, v) for k, v in value.items()}
+        return value
@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from .storage import JsonFile
+
+
+class Timer:
+    """
+    A pending $timer
+    Holds only plain values so that it can be saved to disk
+    """
+    __slots__ = ('id', 'deadline', 'author_id', 'author', 'own', 'channel_id', 'channel', 'server',
+                 'timestamp', 'minutes', 'seconds')
+
+    def __init__(self, **fields):
+        for key in self.__slots__:
+            setattr(self, key, fields[key])
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class TimerScheduler:
+    """
+    Runs every timer from a single task ordered by a heap of deadlines
+    Pending timers are saved to a file so they survive restarts
+    """
+
+    def __init__(self, file, callback):
+        self.callback = callback
+        self._file = JsonFile(file)
+        self._heap = []
+        self._timers = {}
+        self._next_id = 1
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def load(self):
+        """
+        Loads timers saved by a previous run
+        """
+        if not os.path.isfile(self._file.file):
+            return
+        for data in list(self._file.load().values()):
+            self._push(Timer(**data))
+
+    def start(self):
+        """
+        Starts running timers, firing any that finished while offline
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._file.flush()
+
+    def add(self, delay, **fields):
+        """
+        Adds a timer that finishes after the delay in seconds
+        """
+        timer = Timer(id=self._next_id, deadline=time.time() + delay, **fields)
+        self._push(timer)
+        self._file.mark_dirty()
+        return timer
+
+    def get(self, id):
+        return self._timers.get(id)
+
+    def cancel(self, id):
+        """
+        Cancels a timer by ID, returning it if it was pending
+        """
+        timer = self._timers.pop(id, None)
+        if timer is not None:
+            # The heap entry is skipped once it comes up
+            del self._file.data[str(id)]
+            self._file.mark_dirty()
+        return timer
+
+    def pending(self, limit=None):
+        """
+        Returns pending timers, soonest first
+        """
+        if limit is None:
+            return sorted(self._timers.values(), key=lambda t: t.deadline)
+        return heapq.nsmallest(limit, self._timers.values(), key=lambda t: t.deadline)
+
+    def _push(self, timer):
+        self._timers[timer.id] = timer
+        self._file.data[str(timer.id)] = timer.to_dict()
+        self._next_id = max(self._next_id, timer.id + 1)
+        if not self._heap or timer.deadline < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (timer.deadline, timer.id))
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            fired = False
+            while self._heap and self._heap[0][0] <= now:
+                deadline, id = heapq.heappop(self._heap)
+                timer = self._timers.pop(id, None)
+                if timer is not None:
+                    fired = True
+                    del self._file.data[str(id)]
+                    asyncio.ensure_future(self.callback(timer, now - deadline))
+            # Drop cancelled timers at the front so the wait below is accurate
+            while self._heap and self._heap[0][1] not in self._timers:
+                heapq.heappop(self._heap)
+            if fired:
+                self._file.mark_dirty()
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class DeletionScheduler:
+    """
+    Deletes messages once their delete_after time has passed
+    Runs from a single task, handing due messages over grouped by channel
+    """
+
+    def __init__(self, delete):
+        self.delete = delete
+        self._heap = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, message, delay):
+        """
+        Schedules a message to be deleted after the delay in seconds
+        """
+        deadline = time.monotonic() + delay
+        if not self._heap or deadline < self._heap[0][0]:
+            self._wakeup.set()
+        # The counter keeps messages from ever being compared
+        heapq.heappush(self._heap, (deadline, next(self._counter), message))
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def flush(self):
+        """
+        Deletes every pending message straight away
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        messages = [entry[2] for entry in self._heap]
+        self._heap.clear()
+        await asyncio.gather(*[self.delete(group) for group in self._group(messages)])
+
+    def _group(self, messages):
+        channels = {}
+        for message in messages:
+            channels.setdefault(message.channel.id, []).append(message)
+        return channels.values()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+            for group in self._group(due):
+                asyncio.ensure_future(self.delete(group))
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,720 @@
+import array
+import asyncio
+import bisect
+import datetime
+import heapq
+import logging
+import math
+import re
+import time
+from itertools import accumulate, repeat
+
+from .exceptions import QueryError
+
+log = logging.getLogger('turbo.search')
+
+DISCORD_EPOCH = 1420070400000
+
+# Postings per compressed block, longer lists get skip data per block
+BLOCK = 128
+
+_WORD = re.compile(r'\w+')
+_QUERY = re.compile(r'"[^"]*"?|\(|\)|[^\s()"]+')
+_MENTION = re.compile(r'[<#@!&>]')
+# Channels and authors are indexed as tokens that can't appear in text
+_CHANNEL = '\x00c'
+_AUTHOR = '\x00a'
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def snowflake_at(date):
+    """
+    Returns the lowest Discord ID created at a UTC datetime
+    """
+    ms = int((date - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    return max(ms - DISCORD_EPOCH, 0) << 22
+
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def _put_positions(out, offsets):
+    """
+    Encodes the positions of a token in a message as their amount followed by their deltas
+    """
+    _put_varint(out, len(offsets))
+    last = 0
+    for offset in offsets:
+        _put_varint(out, offset - last)
+        last = offset
+
+
+def _read_positions(data):
+    """
+    Returns the position deltas of each message in a stream written by _put_positions
+    """
+    values = _varints(data)
+    deltas = []
+    k = 0
+    while k < len(values):
+        count = values[k]
+        deltas.append(values[k + 1:k + 1 + count])
+        k += 1 + count
+    return deltas
+
+
+def _varints(data):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class _Encoder:
+    """
+    Compresses the (ordinal, positions) postings of a token, added in order of ordinal
+    Ordinals are delta encoded, and positions go in a separate stream as the amount of
+    positions followed by their deltas, so that only phrases decode them. Lists longer
+    than a block get skip data: the last ordinal of each block and where the block starts
+    """
+    __slots__ = ('docs', 'positions', 'lasts', 'doc_starts', 'position_starts', 'count', 'previous')
+
+    def __init__(self):
+        self.docs = bytearray()
+        self.positions = bytearray()
+        self.lasts = array.array('I')
+        self.doc_starts = array.array('I')
+        self.position_starts = array.array('I')
+        self.count = 0
+        self.previous = 0
+
+    def add(self, ordinal, offsets):
+        if not self.count % BLOCK:
+            if self.count:
+                self.lasts.append(self.previous)
+            self.doc_starts.append(len(self.docs))
+            self.position_starts.append(len(self.positions))
+        self.count += 1
+        _put_varint(self.docs, ordinal - self.previous)
+        self.previous = ordinal
+        _put_positions(self.positions, offsets)
+
+    def finish(self):
+        """
+        Returns the encoded postings, and the skip data or None
+        """
+        self.lasts.append(self.previous)
+        header = bytearray()
+        _put_varint(header, len(self.docs))
+        data = bytes(header + self.docs + self.positions)
+        if len(self.lasts) == 1:
+            return data, None
+        return data, (self.lasts, self.doc_starts, self.position_starts)
+
+
+class _MemorySegment:
+    """
+    Segment that new messages are added to, kept uncompressed
+    Ordinals are in the order messages arrived, and queries are matched with sets
+    """
+
+    def __init__(self):
+        self.ids = array.array('Q')
+        self.channels = array.array('Q')
+        self.authors = array.array('Q')
+        self.postings = {}
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, id, channel_id, author_id, words):
+        ordinal = len(self.ids)
+        self.ids.append(id)
+        self.channels.append(channel_id)
+        self.authors.append(author_id)
+        offsets = {}
+        for offset, word in enumerate(words):
+            offsets.setdefault(word, []).append(offset)
+        offsets['{}{}'.format(_CHANNEL, channel_id)] = ()
+        offsets['{}{}'.format(_AUTHOR, author_id)] = ()
+        # Arrays and byte strings keep the garbage collector from tracking every posting
+        for token, found in offsets.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array.array('I')
+                self.positions[token] = bytearray()
+            postings.append(ordinal)
+            _put_positions(self.positions[token], found)
+
+    def docs(self, token):
+        return self.postings.get(token, ())
+
+    def offsets(self, token):
+        deltas = _read_positions(self.positions.get(token, b''))
+        return dict(zip(self.postings.get(token, ()), (list(accumulate(d)) for d in deltas)))
+
+    def select(self, ordinals, after, before):
+        ids = self.ids
+        return {o for o in ordinals if (after is None or ids[o] >= after) and (before is None or ids[o] < before)}
+
+    def everything(self, after, before):
+        return self.select(range(len(self.ids)), after, before)
+
+
+class _Segment:
+    """
+    Immutable segment with compressed posting lists
+    Ordinals are sorted by ID, so time ranges are ordinal ranges
+    and the newest matches are found by walking ordinals downwards
+    """
+
+    def __init__(self, ids, channels, authors, terms, skips):
+        self.ids = ids
+        self.channels = channels
+        self.authors = authors
+        self.terms = terms
+        self.skips = skips
+
+    def __len__(self):
+        return len(self.ids)
+
+    def range(self, after, before):
+        low = bisect.bisect_left(self.ids, after) if after is not None else 0
+        high = bisect.bisect_left(self.ids, before) if before is not None else len(self.ids)
+        return low, high
+
+    def postings(self, token):
+        """
+        Yields the (ordinal, positions) postings of a token a block at a time
+        """
+        cursor = _Term(self, token)
+        for block in range(cursor.blocks):
+            yield cursor.block_postings(block)
+
+
+class _Term:
+    """
+    Cursor over the posting list of a token in a segment
+    Only the blocks that are visited are decoded
+    """
+
+    def __init__(self, segment, token):
+        self.data = segment.terms.get(token)
+        self.block = None
+        self.docs = []
+        self.offsets = None
+        if self.data is None:
+            self.size = self.blocks = 0
+            return
+        length, self.start = _read_varint(self.data, 0)
+        self.positions_start = self.start + length
+        skips = segment.skips.get(token)
+        if skips is None:
+            self.lasts = None
+            self.blocks = 1
+            self.size = length
+        else:
+            self.lasts, self.doc_starts, self.position_starts = skips
+            self.blocks = len(self.lasts)
+            self.size = self.blocks * BLOCK
+
+    def prev(self, target):
+        """
+        Returns the highest ordinal up to the target, or -1
+        """
+        if self.data is None or target < 0:
+            return -1
+        if self.lasts is None:
+            i = 0
+        else:
+            i = bisect.bisect_left(self.lasts, target)
+            if i == self.blocks:
+                return self.lasts[-1]
+        self._load(i)
+        j = bisect.bisect_right(self.docs, target) - 1
+        if j >= 0:
+            return self.docs[j]
+        return self.lasts[i - 1] if i else -1
+
+    def positions(self, ordinal):
+        """
+        Returns the positions of the token in a message it's in
+        """
+        i = bisect.bisect_left(self.lasts, ordinal) if self.lasts is not None else 0
+        self._load(i)
+        if self.offsets is None:
+            self.offsets = self._decode_positions(i)
+        return list(accumulate(self.offsets[bisect.bisect_left(self.docs, ordinal)]))
+
+    def block_postings(self, i):
+        self._load(i)
+        if self.offsets is None:
+            self.offsets = self._decode_positions(i)
+        return [(ordinal, tuple(accumulate(offsets))) for ordinal, offsets in zip(self.docs, self.offsets)]
+
+    def _load(self, i):
+        if i == self.block:
+            return
+        if self.lasts is None:
+            start, end, base = self.start, self.positions_start, 0
+        else:
+            start = self.start + self.doc_starts[i]
+            end = self.start + self.doc_starts[i + 1] if i + 1 < self.blocks else self.positions_start
+            base = self.lasts[i - 1] if i else 0
+        values = _varints(self.data[start:end])
+        values[0] += base
+        self.docs = list(accumulate(values))
+        self.block = i
+        self.offsets = None
+
+    def _decode_positions(self, i):
+        if self.lasts is None:
+            start, end = self.positions_start, len(self.data)
+        else:
+            start = self.positions_start + self.position_starts[i]
+            end = self.positions_start + self.position_starts[i + 1] if i + 1 < self.blocks else len(self.data)
+        return _read_positions(self.data[start:end])
+
+
+class _All:
+
+    def __init__(self, size):
+        self.size = size
+
+    def prev(self, target):
+        return min(target, self.size - 1)
+
+
+class _Or:
+
+    def __init__(self, children):
+        self.children = children
+        self.size = sum(child.size for child in children)
+
+    def prev(self, target):
+        return max(child.prev(target) for child in self.children)
+
+
+class _And:
+    """
+    Leapfrogs its children down to an ordinal they all have,
+    skipping the ones an excluded cursor has as well
+    """
+
+    def __init__(self, children, excluded=()):
+        self.children = sorted(children, key=lambda child: child.size)
+        self.excluded = excluded
+        self.size = self.children[0].size
+
+    def prev(self, target):
+        x = target
+        while x >= 0:
+            for child in self.children:
+                y = child.prev(x)
+                if y != x:
+                    x = y
+                    break
+            else:
+                if not any(child.prev(x) == x for child in self.excluded):
+                    return x
+                x -= 1
+        return -1
+
+
+class _Phrase:
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.both = _And(terms)
+        self.size = self.both.size
+
+    def prev(self, target):
+        x = self.both.prev(target)
+        while x >= 0 and not self._adjacent(x):
+            x = self.both.prev(x - 1)
+        return x
+
+    def _adjacent(self, ordinal):
+        starts = set(self.terms[0].positions(ordinal))
+        for i, term in enumerate(self.terms[1:], 1):
+            starts &= {p - i for p in term.positions(ordinal)}
+            if not starts:
+                return False
+        return True
+
+
+def _cursor(node, segment):
+    kind = node[0]
+    if kind == 'term':
+        return _Term(segment, node[1])
+    if kind == 'phrase':
+        return _Phrase([_Term(segment, word) for word in node[1]])
+    if kind == 'or':
+        return _Or([_cursor(child, segment) for child in node[1]])
+    if kind == 'not':
+        return _And([_All(len(segment))], [_cursor(node[1], segment)])
+    included = [_cursor(child, segment) for child in node[1] if child[0] != 'not']
+    excluded = [_cursor(child[1], segment) for child in node[1] if child[0] == 'not']
+    return _And(included or [_All(len(segment))], excluded)
+
+
+class _Parser:
+    """
+    Parses queries into trees of ('term', token), ('phrase', tokens),
+    ('and', nodes), ('or', nodes) and ('not', node)
+    Words next to each other must all match, OR binds looser than that
+    Dates in before:, after: and during: apply to the whole query
+    """
+    filters = ('in', 'from', 'before', 'after', 'during')
+
+    def __init__(self, query):
+        self.tokens = _QUERY.findall(query)
+        self.position = 0
+        self.after = None
+        self.before = None
+
+    def parse(self):
+        node = self.expression()
+        if self.peek() is not None:
+            raise QueryError("Unexpected `{}` in search".format(self.peek()))
+        return node
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def expression(self):
+        nodes = [self.conjunction()]
+        while self.peek() == 'OR':
+            self.position += 1
+            nodes.append(self.conjunction())
+        if len(nodes) == 1:
+            return nodes[0]
+        if None in nodes:
+            raise QueryError("OR needs something to search for on both sides")
+        return ('or', nodes)
+
+    def conjunction(self):
+        nodes = []
+        while self.peek() not in (None, ')', 'OR'):
+            if self.peek() == 'AND':
+                self.position += 1
+                continue
+            node = self.unary()
+            if node is not None:
+                nodes.append(node)
+        if not nodes:
+            return None
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def unary(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        if token == 'NOT' or (token.startswith('-') and len(token) > 1):
+            if token != 'NOT':
+                self.position -= 1
+                self.tokens[self.position] = token[1:]
+            if self.peek() is None:
+                raise QueryError("NOT needs something to leave out")
+            node = self.unary()
+            if node is None:
+                raise QueryError("NOT needs something to leave out")
+            return ('not', node)
+        if token == '(':
+            node = self.expression()
+            if self.peek() != ')':
+                raise QueryError("Missing `)` in search")
+            self.position += 1
+            return node
+        if token.startswith('"'):
+            return self.words(token.strip('"'))
+        name, colon, value = token.partition(':')
+        if colon and value and name.lower() in self.filters:
+            return self.filter(name.lower(), value)
+        return self.words(token)
+
+    def words(self, text):
+        words = tokenize(text)
+        if not words:
+            return None
+        return ('term', words[0]) if len(words) == 1 else ('phrase', words)
+
+    def filter(self, name, value):
+        if name in ('in', 'from'):
+            id = _MENTION.sub('', value)
+            if not id.isdigit():
+                raise QueryError("`{}:` takes an ID or a mention".format(name))
+            return ('term', '{}{}'.format(_CHANNEL if name == 'in' else _AUTHOR, int(id)))
+        try:
+            date = datetime.datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise QueryError("Write dates like 2017-01-31")
+        day = datetime.timedelta(days=1)
+        if name in ('after', 'during'):
+            low = snowflake_at(date + day if name == 'after' else date)
+            self.after = low if self.after is None else max(self.after, low)
+        if name in ('before', 'during'):
+            high = snowflake_at(date + day if name == 'during' else date)
+            self.before = high if self.before is None else min(self.before, high)
+        return None
+
+
+def _match(node, segment):
+    """
+    Returns the ordinals of an uncompressed segment matching a query tree
+    """
+    kind = node[0]
+    if kind == 'term':
+        return set(segment.docs(node[1]))
+    if kind == 'phrase':
+        return _phrase(node[1], segment)
+    if kind == 'or':
+        return set().union(*(_match(child, segment) for child in node[1]))
+    if kind == 'not':
+        return set(range(len(segment))) - _match(node[1], segment)
+    included = [child for child in node[1] if child[0] != 'not']
+    excluded = [child[1] for child in node[1] if child[0] == 'not']
+    if included:
+        sets = sorted((_match(child, segment) for child in included), key=len)
+        result = sets[0].intersection(*sets[1:])
+    else:
+        result = set(range(len(segment)))
+    for child in excluded:
+        if not result:
+            break
+        result -= _match(child, segment)
+    return result
+
+
+def _phrase(words, segment):
+    offsets = [segment.offsets(word) for word in words]
+    if not all(offsets):
+        return set()
+    found = set()
+    for ordinal in set(offsets[0]).intersection(*offsets[1:]):
+        starts = set(offsets[0][ordinal])
+        for i, positions in enumerate(offsets[1:], 1):
+            starts &= {p - i for p in positions[ordinal]}
+            if not starts:
+                break
+        if starts:
+            found.add(ordinal)
+    return found
+
+
+class SearchIndex:
+    """
+    Incremental inverted index of the messages seen
+    New messages go into an uncompressed segment, which is compressed once
+    it's full. Segments of the same size tier are merged, so a query only has
+    to visit a few. That work runs in a background task which gives the
+    loop back every few milliseconds
+    """
+
+    def __init__(self, flush_size=4096, fanout=4, max_messages=500000, step=0.005):
+        self.flush_size = flush_size
+        self.fanout = fanout
+        self.max_messages = max_messages
+        self.step = step
+        self.segments = []
+        self._memory = _MemorySegment()
+        self._freezing = []
+        self._task = None
+        self._slice = 0
+
+    def __len__(self):
+        return sum(map(len, self.segments)) + sum(map(len, self._freezing)) + len(self._memory)
+
+    def add(self, id, channel_id, author_id, content):
+        try:
+            self._memory.add(int(id), int(channel_id), int(author_id), tokenize(content))
+        except ValueError:
+            return  # Not a real Discord message
+        if len(self._memory) >= self.flush_size:
+            self._freezing.append(self._memory)
+            self._memory = _MemorySegment()
+            if self._task is None or self._task.done():
+                self._task = asyncio.ensure_future(self._maintain())
+
+    def search(self, query, limit=10):
+        """
+        Returns the newest (ID, channel ID, author ID) matches of a query
+        Compressed segments are walked from their newest message down,
+        and stop as soon as nothing older can make the results
+        """
+        parser = _Parser(query)
+        tree = parser.parse()
+        after, before = parser.after, parser.before
+        if tree is None and after is None and before is None:
+            raise QueryError("Nothing to search for")
+        newest = []
+        for segment in sorted(self.segments, key=lambda s: s.ids[-1], reverse=True):
+            if len(newest) >= limit and segment.ids[-1] <= newest[0][0]:
+                break
+            low, high = segment.range(after, before)
+            cursor = _cursor(tree, segment) if tree is not None else _All(len(segment))
+            ordinal = cursor.prev(high - 1)
+            while ordinal >= low:
+                if not self._keep(newest, limit, segment, ordinal):
+                    break
+                ordinal = cursor.prev(ordinal - 1)
+        for segment in self._freezing + [self._memory]:
+            if tree is None:
+                found = segment.everything(after, before)
+            else:
+                found = segment.select(_match(tree, segment), after, before)
+            for ordinal in heapq.nlargest(limit, found, key=segment.ids.__getitem__):
+                if not self._keep(newest, limit, segment, ordinal):
+                    break
+        return sorted(newest, reverse=True)
+
+    def _keep(self, newest, limit, segment, ordinal):
+        """
+        Adds a match to the heap of the newest ones, returns False if it was too old
+        """
+        match = (segment.ids[ordinal], segment.channels[ordinal], segment.authors[ordinal])
+        if len(newest) < limit:
+            heapq.heappush(newest, match)
+        elif match[0] > newest[0][0]:
+            heapq.heapreplace(newest, match)
+        else:
+            return False
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _pause(self):
+        if time.perf_counter() - self._slice > self.step:
+            await asyncio.sleep(0)
+            self._slice = time.perf_counter()
+
+    async def _maintain(self):
+        """
+        Compresses full segments, drops the oldest ones past the maximum
+        and merges segments until no tier has enough of them
+        """
+        self._slice = time.perf_counter()
+        try:
+            while self._freezing or self._merge_group():
+                if self._freezing:
+                    segment = await self._freeze(self._freezing[0])
+                    self._freezing.pop(0)
+                    self.segments.append(segment)
+                    self._apply_retention()
+                    continue
+                group = self._merge_group()
+                segment = await self._merge(group)
+                first = self.segments.index(group[0])
+                self.segments = [s for s in self.segments if s not in group]
+                self.segments.insert(first, segment)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("Search index maintenance failed: %s", e)
+
+    def _apply_retention(self):
+        total = len(self)
+        while total > self.max_messages and len(self.segments) > 1:
+            total -= len(self.segments.pop(0))
+
+    def _merge_group(self):
+        """
+        Returns the first segments of the lowest tier that has enough of them
+        """
+        tiers = {}
+        for segment in self.segments:
+            tier = int(math.log(max(len(segment) / self.flush_size, 1), self.fanout))
+            tiers.setdefault(tier, []).append(segment)
+        for tier, segments in sorted(tiers.items()):
+            if len(segments) >= self.fanout:
+                return segments[:self.fanout]
+        return None
+
+    async def _freeze(self, memory):
+        order = sorted(range(len(memory)), key=memory.ids.__getitem__)
+        remap = [0] * len(order)
+        for new, old in enumerate(order):
+            remap[old] = new
+        await self._pause()
+        terms = {}
+        skips = {}
+        for token, ordinals in memory.postings.items():
+            encoder = _Encoder()
+            deltas = _read_positions(memory.positions[token])
+            for count, (ordinal, offsets) in enumerate(sorted(zip((remap[o] for o in ordinals), deltas)), 1):
+                encoder.add(ordinal, list(accumulate(offsets)))
+                if not count % BLOCK:
+                    await self._pause()
+            terms[token], skip = encoder.finish()
+            if skip is not None:
+                skips[token] = skip
+            await self._pause()
+        return _Segment(array.array('Q', (memory.ids[o] for o in order)),
+                        array.array('Q', (memory.channels[o] for o in order)),
+                        array.array('Q', (memory.authors[o] for o in order)), terms, skips)
+
+    async def _merge(self, segments):
+        ids = array.array('Q')
+        channels = array.array('Q')
+        authors = array.array('Q')
+        remaps = [array.array('I', bytes(4 * len(segment))) for segment in segments]
+        merged = heapq.merge(*(zip(segment.ids, repeat(i), range(len(segment)))
+                               for i, segment in enumerate(segments)))
+        for new, (id, i, o) in enumerate(merged):
+            remaps[i][o] = new
+            ids.append(id)
+            channels.append(segments[i].channels[o])
+            authors.append(segments[i].authors[o])
+            if not new % 1024:
+                await self._pause()
+        tokens = set()
+        for segment in segments:
+            tokens.update(segment.terms)
+        terms = {}
+        skips = {}
+        for token in tokens:
+            postings = []
+            for i, segment in enumerate(segments):
+                remap = remaps[i]
+                for block in segment.postings(token):
+                    postings.extend((remap[o], offsets) for o, offsets in block)
+                    await self._pause()
+            # Segments overlap at most a little, which sorts in about linear time
+            postings.sort()
+            encoder = _Encoder()
+            for count, (ordinal, offsets) in enumerate(postings, 1):
+                encoder.add(ordinal, offsets)
+                if not count % BLOCK:
+                    await self._pause()
+            terms[token], skip = encoder.finish()
+            if skip is not None:
+                skips[token] = skip
+            await self._pause()
+        return _Segment(ids, channels, authors, terms, skips)
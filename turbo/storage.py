@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+
+from .exceptions import printError
+from .log import extra
+from colorama import Fore
+
+log = logging.getLogger('turbo.storage')
+
+
+def write_atomic(file, text):
+    """
+    Writes text to a temporary file next to the target,
+    then renames it over the target so it's never half-written
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file) or '.', suffix='.tmp')
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.isfile(file):
+            os.chmod(tmp, os.stat(file).st_mode)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _save_json(file, data):
+    write_atomic(file, json.dumps(data, indent=4, sort_keys=True))
+
+
+class JsonFile:
+    """
+    JSON file whose changes are batched and written in the background
+    """
+
+    def __init__(self, file, delay=1.0):
+        self.file = file
+        self.delay = delay
+        self.data = {}
+        self._dirty = False
+        self._handle = None
+        self._lock = asyncio.Lock()
+
+    def load(self):
+        """
+        Safely load the file, replacing any data held
+        """
+        if not os.path.isfile(self.file):
+            printError("Failed loading JSON: {}".format(self.file))
+            self.data = {}
+        else:
+            with open(self.file, encoding="utf-8") as f:
+                self.data = json.load(f)
+        return self.data
+
+    def mark_dirty(self):
+        """
+        Schedules the data to be written
+        Changes made before the write happens are saved together
+        """
+        if self._handle is None:
+            loop = asyncio.get_event_loop()
+            self._handle = loop.call_later(self.delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """
+        Writes pending changes, if there are any, and waits for a write in progress
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+            self._dirty = True
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Serialized in the executor from a copy, so later changes can't race with it
+            # Values are strings, or dicts of strings for autoresponses
+            snapshot = {key: dict(value) if isinstance(value, dict) else value for key, value in self.data.items()}
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, _save_json, self.file, snapshot)
+            except OSError as e:
+                printError("Failed saving JSON to {}: {}".format(self.file, e))
+
+
+class JsonStore:
+    """
+    Stores tags and autoresponses in JSON files kept in memory
+    """
+
+    def __init__(self, tags_file, responses_file):
+        self.tags_file = JsonFile(tags_file)
+        self.responses_file = JsonFile(responses_file)
+
+    def load(self):
+        self.tags_file.load()
+        self.responses_file.load()
+
+    def responses(self):
+        return self.responses_file.data
+
+    def get_tag(self, name):
+        return self.tags_file.data.get(name)
+
+    def has_tag(self, name):
+        return name in self.tags_file.data
+
+    async def add_tag(self, name, content):
+        self.tags_file.data[name] = content
+        self.tags_file.mark_dirty()
+
+    async def remove_tag(self, name):
+        del self.tags_file.data[name]
+        self.tags_file.mark_dirty()
+
+    async def clear_tags(self):
+        self.tags_file.data.clear()
+        self.tags_file.mark_dirty()
+
+    def tag_count(self):
+        return len(self.tags_file.data)
+
+    def tag_names(self, offset=0, limit=None):
+        names = sorted(self.tags_file.data)
+        return names[offset:] if limit is None else names[offset:offset + limit]
+
+    def search_tags(self, query, limit=20):
+        """
+        Returns tag names starting with the query,
+        followed by names containing it, ignoring case
+        """
+        query = query.lower()
+        names = sorted(self.tags_file.data)
+        matches = [n for n in names if n.lower().startswith(query)]
+        seen = set(matches)
+        matches += [n for n in names if query in n.lower() and n not in seen]
+        return matches[:limit]
+
+    async def flush(self):
+        await self.responses_file.flush()
+        await self.tags_file.flush()
+
+    async def close(self):
+        await self.flush()
+
+
+class SqliteStore:
+    """
+    Stores tags and autoresponses in a SQLite database
+    Tags are looked up on demand instead of being kept in memory,
+    and changes are committed in the executor through a second connection
+    """
+
+    def __init__(self, database, tags_file, responses_file):
+        self.database = database
+        self.tags_file = tags_file
+        self.responses_file = responses_file
+        created = not os.path.isfile(database)
+        self._db = sqlite3.connect(database)
+        # WAL with normal syncing doesn't fsync on every commit
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+        if created:
+            self.migrate()
+        self._responses = {}
+        self._writer = sqlite3.connect(database, check_same_thread=False)
+        self._writer.execute('PRAGMA synchronous=NORMAL')
+        self._lock = asyncio.Lock()
+
+    def migrate(self):
+        """
+        Imports the tags and autoresponses from the JSON files
+        """
+        tags = _read_json(self.tags_file)
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO tags (name, lower_name, content) VALUES (?, ?, ?)',
+                                 ((name, name.lower(), content) for name, content in tags.items()))
+        self._import_responses()
+        log.info("Imported %s tags from %s into %s", len(tags), self.tags_file, self.database,
+                 extra=extra(Fore.GREEN))
+
+    def _import_responses(self):
+        responses = _read_json(self.responses_file)
+        rows = []
+        for channel, triggers in responses.items():
+            for position, (trigger, response) in enumerate(triggers.items()):
+                rows.append((channel, trigger, response, position))
+        mtime = os.path.getmtime(self.responses_file) if os.path.isfile(self.responses_file) else 0
+        with self._db:
+            self._db.execute('DELETE FROM responses')
+            self._db.executemany(
+                'INSERT INTO responses (channel, trigger, response, position) VALUES (?, ?, ?, ?)', rows)
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('responses_mtime', ?)", (mtime,))
+
+    def load(self):
+        """
+        Loads the autoresponses, importing the JSON file again if it was edited
+        """
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'responses_mtime'").fetchone()
+        if os.path.isfile(self.responses_file) and (not row or os.path.getmtime(self.responses_file) > row[0]):
+            self._import_responses()
+        responses = {}
+        for channel, trigger, response in self._db.execute(
+                'SELECT channel, trigger, response FROM responses ORDER BY channel, position'):
+            responses.setdefault(channel, OrderedDict())[trigger] = response
+        self._responses = responses
+
+    def responses(self):
+        return self._responses
+
+    def get_tag(self, name):
+        row = self._db.execute('SELECT content FROM tags WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def has_tag(self, name):
+        return self.get_tag(name) is not None
+
+    async def add_tag(self, name, content):
+        await self._write('INSERT OR REPLACE INTO tags (name, lower_name, content) VALUES (?, ?, ?)',
+                          (name, name.lower(), content))
+
+    async def remove_tag(self, name):
+        await self._write('DELETE FROM tags WHERE name = ?', (name,))
+
+    async def clear_tags(self):
+        await self._write('DELETE FROM tags')
+
+    async def _write(self, sql, parameters=()):
+        # One write at a time, as the writer connection is shared between executor threads
+        async with self._lock:
+            await asyncio.get_event_loop().run_in_executor(None, self._commit, sql, parameters)
+
+    def _commit(self, sql, parameters):
+        with self._writer:
+            self._writer.execute(sql, parameters)
+
+    def tag_count(self):
+        return self._db.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def tag_names(self, offset=0, limit=None):
+        rows = self._db.execute('SELECT name FROM tags ORDER BY name LIMIT ? OFFSET ?',
+                                (-1 if limit is None else limit, offset))
+        return [row[0] for row in rows]
+
+    def search_tags(self, query, limit=20):
+        """
+        Returns tag names starting with the query,
+        followed by names containing it, ignoring case
+        """
+        query = query.lower()
+        # Everything starting with the query sorts between it and the query followed by the highest character
+        matches = [row[0] for row in self._db.execute(
+            'SELECT name FROM tags WHERE lower_name >= ? AND lower_name < ? ORDER BY lower_name LIMIT ?',
+            (query, query + '\U0010ffff', limit))]
+        if len(matches) < limit:
+            matches += [row[0] for row in self._db.execute(
+                'SELECT name FROM tags WHERE instr(lower_name, ?) > 1 ORDER BY lower_name LIMIT ?',
+                (query, limit - len(matches)))]
+        return matches
+
+    async def flush(self):
+        async with self._lock:
+            pass
+
+    async def close(self):
+        await self.flush()
+        self._writer.close()
+        self._db.close()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY,
+    lower_name TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_lower_name ON tags (lower_name);
+CREATE TABLE IF NOT EXISTS responses (
+    channel TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    response TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (channel, trigger)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+def _read_json(file):
+    if not os.path.isfile(file):
+        return {}
+    with open(file, encoding="utf-8") as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
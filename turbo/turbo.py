@@ -7,39 +7,85 @@
 
 import discord
 import asyncio
-import traceback
-import inspect
+import logging
 import datetime
-import json
-import os
+import time
 import random
-import requests
 import easy_date
 import date_converter
 import steamapi
+import requests
 import subprocess
 from colorama import Fore
 from functools import wraps
 from discord.ext.commands.bot import _get_variable
-from .exceptions import FatalError, printError
-from .utils import load_file, VERSION, ApiBase
+from .exceptions import FatalError, RequestError, QueryError, printError
+from .log import setup_logging, extra
+from .http import HTTPClient, ResponseCache, api_name
+from .commands import build_commands
+from .matcher import ResponseMatcher
+from .cache import MessageStore
+from .archive import MessageArchive
+from .search import SearchIndex
+from .index import MemberIndex, EmojiIndex
+from .storage import JsonStore, SqliteStore
+from .scheduler import TimerScheduler, DeletionScheduler
+from .outbound import OutboundQueue, MESSAGE_LIMIT
+from .metrics import Metrics
+from .watchdog import Watchdog
+from .sandbox import Sandbox
+from .prefilter import Prefilter
+from .pool import ContentPool
+from .utils import load_file, count_list_entries, VERSION, ApiBase
 from .config import Config
 
+log = logging.getLogger('turbo')
+command_log = logging.getLogger('turbo.commands')
+response_log = logging.getLogger('turbo.responses')
+
 
 class Turbo(discord.Client):
 
     def __init__(self):
         print(
             "{}Turbo - Version {} - jaydenkieran.com/turbo{}".format(Fore.GREEN, VERSION, Fore.RESET))
-        super().__init__()
+        # Commands look messages up in the message store, so discord.py's
+        # own cache of full Message objects is kept at its minimum
+        super().__init__(max_messages=100)
+        # on_message_edit only covers that cache, so edits of older
+        # messages in the message store are taken from the raw event
+        self._parse_message_update = self.connection.parse_message_update
+        self.connection.parse_message_update = self._on_raw_message_update
         self.config = Config()
-        self._reload()
-
-        self.max_messages = self.config.messages
+        self.log_listener = setup_logging(self.config)
+        self.response_matcher = ResponseMatcher()
+        self.prefilter = Prefilter(self.config.prefix)
         self.blacklist = set(load_file('config/blacklist.txt'))
         self.disabled = False
+        if self.config.storage == 'sqlite':
+            self.store = SqliteStore(self.config.database, 'config/tags.json', 'config/responses.json')
+        else:
+            self.store = JsonStore('config/tags.json', 'config/responses.json')
+        self._reload()
 
-        self.timers = []
+        self.message_store = MessageStore(self.config.messages, ttl=self.config.message_ttl)
+        self.archive = None
+        if self.config.archive:
+            self.archive = MessageArchive(self.config.archive_directory,
+                                          self.config.archive_segment_size * 1024 * 1024,
+                                          self.config.archive_max_size * 1024 * 1024)
+            self.archive.load()
+        self.search_index = SearchIndex(max_messages=self.config.search_max) if self.config.search else None
+        self.search_results = 10
+        self.member_index = MemberIndex()
+        self.emoji_index = EmojiIndex()
+
+        self.outbound = OutboundQueue(self._send_message_now, self._edit_message_now)
+        self.deletions = DeletionScheduler(self._delete_messages_now)
+        self.timer_scheduler = TimerScheduler('config/timers.json', self._handle_timer)
+        self.timer_scheduler.load()
+        self.timers_per_list = 20
+        self.stats_rows = 10
         self.timer_failure = ":warning: Provide time in a format such as **01:00** for one minute"
 
         self.holidays_countries = ['BE', 'BG', 'BR', 'CA', 'CZ', 'DE', 'ES', 'FR', 'GB',
@@ -47,9 +93,42 @@ class Turbo(discord.Client):
 
         self.name_genders = ['male', 'female']
 
+        self.steam_connection = None
+        self.hearthstone_cards = (None, 0)
+        self.steam_statuses = {0: "**offline** :x:", 1: "**online** :white_check_mark:", 2: "**busy** :no_entry:",
+                               3: "**away** :negative_squared_cross_mark:", 4: "**on snooze** :zzz:",
+                               5: "**looking to trade** :twisted_rightwards_arrows:",
+                               6: "**looking to play** :video_game:"}
+        self.tags_per_page = 50
+
         self.color = self.config.color
         self.mashape_headers = {'X-Mashape-Key': self.config.mashape}
 
+        self.http_client = HTTPClient(timeout=self.config.http_timeout, timeouts=self.config.api_timeouts,
+                                      concurrency=self.config.http_concurrency,
+                                      connections_per_host=self.config.http_connections,
+                                      cache=ResponseCache(self.config.cache_ttls, self.config.cache_size),
+                                      retries=self.config.http_retries,
+                                      breaker_threshold=self.config.breaker_threshold,
+                                      breaker_cooldown=self.config.breaker_cooldown)
+
+        self.commands = build_commands(self, self.config.prefix)
+
+        self.metrics = Metrics(self.config.metrics_file, self.config.metrics_interval)
+        self.metrics.caches['messages'] = self.message_store
+        self.metrics.caches['http'] = self.http_client.cache
+        if self.archive is not None:
+            self.metrics.caches['archive'] = self.archive
+        self.pools = {}
+        for name, fetch in [('cat', self._fetch_cat), ('joke', self._fetch_joke),
+                            ('yomama', self._fetch_yomama), ('quote', self._fetch_quote)]:
+            size = self.config.pool_sizes[name] if name != 'quote' or self.config.mashape else 0
+            self.pools[name] = ContentPool(name, fetch, size)
+            self.metrics.caches['pool_{}'.format(name)] = self.pools[name]
+        self.watchdog = Watchdog(self.loop, self.config.watchdog_threshold)
+        self.eval_sessions = {}
+        self.sandbox = Sandbox(self, self.config.eval_timeout, self.config.eval_memory * 1024 * 1024)
+
     def no_private(func):
         """
         Decorator to disallow using a command in a PrivateChannel
@@ -78,61 +157,83 @@ class Turbo(discord.Client):
                 return await self._check_bot(msg, ':warning: You need to provide a Mashape API key in the config', delete_after=30)
         return wrapper
 
-    def _reload(self, save=False):
+    def _reload(self):
         """
         Reloads required files
         """
-        if save:
-            self.save_json('config/responses.json', self.responses)
-            self.save_json('config/tags.json', self.tags)
-        self.responses = self.load_json('config/responses.json')
-        self.tags = self.load_json('config/tags.json')
-
-    def load_json(self, file):
-        """
-        Safely load a JSON file
-        """
-        if not os.path.isfile(file):
-            printError("Failed loading JSON: {}".format(file))
-            return {}
-        with open(file, encoding="utf-8") as f:
-            return json.load(f)
-
-    def save_json(self, file, data):
-        """
-        Safely save a JSON file
-        """
-        if not os.path.isfile(file):
-            printError("Failed saving JSON to: {}".format(file))
-            return False
-        with open(file, 'w', encoding="utf-8") as f:
-            return json.dump(data, f, indent=4, sort_keys=True)
+        self.store.load()
+        self.responses = self.store.responses()
+        self.response_matcher.update(self.responses)
+        self.prefilter.rebuild(self)
 
     def run(self):
         """
         Send authentication to Discord and start bot
         """
-        print("Authenticating...")
+        log.info("Authenticating...")
         try:
             super().run(self.config.token, bot=self.config.bot)
         except discord.errors.LoginFailure as e:
             raise FatalError("Failed to authenticate: {}".format(e))
 
-    async def _delete_msg(self, msg, delete):
-        """
-        Handler function for deleting messages after a period of time
-        """
-        await asyncio.sleep(delete)
-        await self.safe_delete_message(msg)
+    async def close(self):
+        """
+        Saves pending changes and closes the API connection pools
+        along with the Discord connection
+        """
+        self.metrics.stop()
+        self.watchdog.stop()
+        for pool in self.pools.values():
+            await pool.stop()
+        self.sandbox.close()
+        await self.deletions.flush()
+        await self.timer_scheduler.stop()
+        await self.store.close()
+        if self.archive is not None:
+            await self.archive.close()
+        if self.search_index is not None:
+            await self.search_index.close()
+        await self.http_client.close()
+        await super().close()
+        self.log_listener.stop()
+
+    async def _delete_messages_now(self, messages):
+        """
+        Deletes messages from one channel, used by the deletion scheduler
+        Bot accounts delete them in bulk
+        """
+        if not self.user.bot:
+            for msg in messages:
+                await self.safe_delete_message(msg)
+            return
+        # Bulk deletes take between 2 and 100 messages
+        for i in range(0, len(messages), 100):
+            chunk = messages[i:i + 100]
+            if len(chunk) == 1:
+                await self.safe_delete_message(chunk[0])
+                continue
+            try:
+                await self.delete_messages(chunk)
+            except discord.HTTPException:
+                printError("Failed bulk deleting {} messages, deleting them one by one".format(len(chunk)))
+                for msg in chunk:
+                    await self.safe_delete_message(msg)
 
     async def safe_edit_message(self, message, content, delete_after=0):
         """
         Allows editing a message safely
+        Edits are queued to stay within rate limits
+        """
+        return await self.outbound.edit(message, content, delete_after)
+
+    async def _edit_message_now(self, message, content, delete_after=0):
+        """
+        Edits a message straight away, used by the outbound queue
         """
         try:
             msg = await self.edit_message(message, content)
             if msg and delete_after:
-                asyncio.ensure_future(self._delete_msg(msg, delete_after))
+                self.deletions.add(msg, delete_after)
             return msg
         except discord.HTTPException:
             printError("Failed editing message: {}".format(message.id))
@@ -149,14 +250,22 @@ class Turbo(discord.Client):
             printError(
                 "No permission to delete message: {}".format(message.id))
 
-    async def safe_send_message(self, dest, content, delete_after=0):
+    async def safe_send_message(self, dest, content, delete_after=0, coalesce=False):
         """
         Allows sending a message safely
+        Messages are queued to stay within rate limits
+        With coalesce, it can be merged with other queued messages to the same place
+        """
+        return await self.outbound.send(dest, content, delete_after, coalesce)
+
+    async def _send_message_now(self, dest, content, delete_after=0):
+        """
+        Sends a message straight away, used by the outbound queue
         """
         try:
             msg = await self.send_message(dest, content)
             if msg and delete_after:
-                asyncio.ensure_future(self._delete_msg(msg, delete_after))
+                self.deletions.add(msg, delete_after)
             return msg
         except discord.HTTPException:
             printError("Failed sending message to: {}".format(dest.name))
@@ -173,54 +282,140 @@ class Turbo(discord.Client):
         """
         if message.channel.id in self.responses.keys():
             responses = self.responses[str(message.channel.id)]
-            for r in responses:
-                if r in message.content:
-                    print("{0}{1.name} ({1.id}) {2}Response: {0}{3}".format(
-                        self.color, message.author, Fore.RESET, r))
-                    await self.safe_send_message(message.channel, responses[r])
+            sends = []
+            for r in self.response_matcher.match(message.channel.id, message.content):
+                response_log.info("Response: %s", r, extra=extra(
+                    self.color, "{0.name} ({0.id})".format(message.author),
+                    author_id=message.author.id, channel_id=message.channel.id, trigger=r))
+                sends.append(self.safe_send_message(message.channel, responses[r], coalesce=True))
+            # Queued together so that they can be merged into one message
+            await asyncio.gather(*sends)
 
     async def on_ready(self):
         """
         Called when the bot is connected successfully
         """
         if self.user.bot:
-            print(self.color + """Warning: Detected you are running this bot on an oAuth account
+            log.warning("""Warning: Detected you are running this bot on an oAuth account
 While not intended, it is possible for this bot to run on these accounts.
-Some commands may work weird, and additionally, they can be triggered by everyone""" + Fore.RESET)
-        print('Logged in as {}'.format(self.user))
+Some commands may work weird, and additionally, they can be triggered by everyone""", extra=extra(self.color))
+        log.info('Logged in as %s', self.user)
+        self.member_index.rebuild(self.servers)
+        self.emoji_index.rebuild(self.servers)
+        self.prefilter.rebuild(self)
+        self.prefilter.ready = True
+        self.timer_scheduler.start()
+        self.metrics.start()
+        for pool in self.pools.values():
+            pool.start()
+        if self.config.watchdog_threshold:
+            self.watchdog.start()
         if self.config.moderator:
             mods = []
             for u in self.config.moderator:
-                user = discord.utils.get(self.get_all_members(), id=u)
+                user = self.member_index.get(u)
                 if user:
                     name = "{}#{}".format(user.name, user.discriminator)
                     mods.append(name)
                 else:
-                    mods.append(id)
+                    mods.append(u)
             mods = ', '.join(mods)
-            print('{}Moderators: {}{}'.format(self.color, mods, Fore.RESET))
+            log.info('Moderators: %s', mods, extra=extra(self.color))
         if self.blacklist:
             blacklist = []
             for u in self.blacklist:
-                user = discord.utils.get(self.get_all_members(), id=u)
+                user = self.member_index.get(u)
                 if user:
                     name = "{}#{}".format(user.name, user.discriminator)
                     blacklist.append(name)
                 else:
-                    blacklist.append(id)
+                    blacklist.append(u)
             blacklist = ', '.join(blacklist)
-            print('{}Blacklisted: {}{}'.format(
-                self.color, blacklist, Fore.RESET))
-        print()
+            log.info('Blacklisted: %s', blacklist, extra=extra(self.color))
 
-    async def on_message(self, message):
+    async def on_server_join(self, server):
+        """
+        Called when the client joins a server
+        """
+        self.member_index.add_server(server)
+        self.emoji_index.add_server(server)
+
+    async def on_server_available(self, server):
+        """
+        Called when a server becomes available
+        """
+        self.member_index.add_server(server)
+        self.emoji_index.add_server(server)
+
+    async def on_server_remove(self, server):
+        """
+        Called when the client leaves a server
+        """
+        self.member_index.remove_server(server)
+        self.emoji_index.remove_server(server)
+
+    async def on_server_unavailable(self, server):
+        """
+        Called when a server becomes unavailable
+        """
+        self.member_index.remove_server(server)
+        self.emoji_index.remove_server(server)
+
+    async def on_server_emojis_update(self, before, after):
+        """
+        Called when the custom emojis of a visible server change
+        """
+        emojis = after or before
+        if emojis:
+            self.emoji_index.add_server(emojis[0].server)
+
+    async def on_member_join(self, member):
+        """
+        Called when a member joins a visible server
         """
-        Called when any message is sent that the client can see
+        self.member_index.add(member)
+
+    async def on_member_update(self, before, after):
+        """
+        Called when a visible member changes
+        """
+        self.member_index.add(after)
+
+    async def on_member_remove(self, member):
+        """
+        Called when a member leaves a visible server
+        """
+        self.member_index.remove(member)
+
+    def dispatch(self, event, *args, **kwargs):
+        """
+        Drops messages that on_message has nothing to do with
+        before any coroutine is created for them
+        wait_for_message still sees every message
+        """
+        if event == 'message' and not self.filter_message(args[0]):
+            self.handle_message(args[0])
+            return
+        super().dispatch(event, *args, **kwargs)
+
+    def filter_message(self, message):
         """
-        await self.wait_until_ready()  # Ensure that the client is ready
+        Caches and indexes a message and returns whether on_message should handle it
+        Messages are only handled once the client is ready
+        """
+        record = self.message_store.add(message)
+        if self.archive is not None:
+            self.archive.add(record)
+        if self.search_index is not None:
+            self.search_index.add(message.id, message.channel.id, message.author.id, message.content)
+        return self.prefilter.ready and self.prefilter.wants(message)
 
+    async def on_message(self, message):
+        """
+        Called when a message passes the prefilter
+        """
         if self.disabled:
-            if message.author == self.user and message.content == "{}enable".format(self.config.prefix):
+            if message.author == self.user and message.content == self.prefilter.enable_command:
                 # Don't do anything if the bot is disabled
                 await self.cmd_enable(message)
             return
@@ -229,7 +424,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
             # Don't do anything if the user is blacklisted
             return
 
-        if message.content == "{}disable".format(self.config.prefix):
+        if message.content == self.prefilter.disable_command:
             if message.author == self.user or message.author.id in self.config.moderator:
                 await self.cmd_disable(message)
                 return
@@ -247,73 +442,58 @@ Some commands may work weird, and additionally, they can be triggered by everyon
             return
 
         command, *args = content.split()
-        command = command[len(self.config.prefix):].lower().strip()
-
-        handler = getattr(self, 'cmd_%s' % command, None)
-        if not handler:
+        command = self.commands.get(command[len(self.config.prefix):].lower().strip())
+        if not command:
             return  # If the command isn't actually a command, do nothing
 
-        print("{0}{1.name} ({1.id}) {2}{3}".format(
-            self.color, message.author, Fore.RESET, content))
-
-        argspec = inspect.signature(handler)
-        params = argspec.parameters.copy()
+        command_log.info(content, extra=extra(
+            self.color, "{0.name} ({0.id})".format(message.author),
+            author_id=message.author.id, channel_id=message.channel.id, command=command.name))
 
+        start = time.monotonic()
+        error = False
         # noinspection PyBroadException
         try:
-            handler_kwargs = {}
-            if params.pop('message', None):
-                handler_kwargs['message'] = message
-
-            if params.pop('channel', None):
-                handler_kwargs['channel'] = message.channel
-
-            if params.pop('author', None):
-                handler_kwargs['author'] = message.author
-
-            if params.pop('server', None):
-                handler_kwargs['server'] = message.server
-
-            if params.pop('player', None):
-                handler_kwargs['player'] = await self.get_player(message.channel)
-
-            if params.pop('user_mentions', None):
-                handler_kwargs['user_mentions'] = list(
-                    map(message.server.get_member, message.raw_mentions))
-
-            if params.pop('channel_mentions', None):
-                handler_kwargs['channel_mentions'] = list(
-                    map(message.server.get_channel, message.raw_channel_mentions))
-
-            if params.pop('voice_channel', None):
-                handler_kwargs[
-                    'voice_channel'] = message.server.me.voice_channel
-
-            if params.pop('leftover_args', None):
-                handler_kwargs['leftover_args'] = args
-
-            args_expected = []
-            for key, param in list(params.items()):
-                doc_key = '[%s=%s]' % (
-                    key, param.default) if param.default is not inspect.Parameter.empty else key
-                args_expected.append(doc_key)
-
-                if not args and param.default is not inspect.Parameter.empty:
-                    params.pop(key)
-                    continue
-
-                if args:
-                    arg_value = args.pop(0)
-                    handler_kwargs[key] = arg_value
-                    params.pop(key)
-
-            if params:
-                await self._check_bot(message, ":warning: Invalid usage: `{}{}`".format(self.config.prefix, command), delete_after=10)
+            handler_kwargs = command.bind(message, args)
+            if handler_kwargs is None:
+                await self._check_bot(message, ":warning: Invalid usage: `{}`".format(command.usage), delete_after=10)
                 return
 
-            response = await handler(**handler_kwargs)
+            response = await command.handler(**handler_kwargs)
+        except RequestError as e:
+            error = True
+            printError(e.message)
+            await self._check_bot(message, ":warning: {}".format(e.message), delete_after=30)
         except Exception:
-            traceback.print_exc()
+            error = True
+            command_log.exception("Error in command %s", command.name)
+        finally:
+            self.metrics.record_command(command.name, time.monotonic() - start, error)
+
+    async def on_message_edit(self, before, after):
+        """
+        Called when a message the client can see is edited
+        """
+        record = self.message_store.add(after)
+        if self.archive is not None:
+            self.archive.add(record)
+
+    def _on_raw_message_update(self, data):
+        """
+        Parses a message update, also updating messages that
+        are only left in the message store
+        """
+        cached = self.connection._get_message(data.get('id')) is not None
+        self._parse_message_update(data)
+        # Updates without content or an author only change embeds
+        if cached or 'content' not in data or 'author' not in data or data.get('id') not in self.message_store:
+            return
+        channel = self.get_channel(data.get('channel_id'))
+        if channel is None:
+            return
+        record = self.message_store.add(self.connection._create_message(channel=channel, **data))
+        if self.archive is not None:
+            self.archive.add(record)
 
     async def _check_bot(self, msgobj, str_to_send, delete_after=0):
         if not self.user.bot and msgobj.author == self.user:
@@ -327,6 +507,11 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         """
         rawdiff = time1 - time2
         time = ""
+        if rawdiff.days > 0:
+            if rawdiff.days == 1:
+                time += "{} day and ".format(rawdiff.days)
+            else:
+                time += "{} days and ".format(rawdiff.days)
         secdiff = int(rawdiff.seconds % 60)
         mindiff = int(rawdiff.seconds/60 % 60)
         hourdiff = int(rawdiff.seconds/60/60)
@@ -346,26 +531,76 @@ Some commands may work weird, and additionally, they can be triggered by everyon
             time += "{} seconds".format(secdiff)
         return time
 
+    def _format_eval(self, code, output, time_taken, session):
+        """
+        Helper function to format eval input and output, truncated to fit in a message
+        """
+        template = "```python\n# Input\n{}\n# Output\n{}\n```\n:stopwatch: Time taken: `{}` - Session: `{}`"
+        if len(code) > MESSAGE_LIMIT // 2:
+            code = code[:MESSAGE_LIMIT // 2] + "..."
+        room = MESSAGE_LIMIT - len(template.format(code, '', time_taken, session))
+        if len(output) > room:
+            output = output[:room - 16] + "\n... (truncated)"
+        return template.format(code, output, time_taken, session)
+
     async def cmd_eval(self, message, args, leftover_args):
         """
-        Evaluates code
+        Evaluates code in your current session, in a separate process so that it can't freeze the bot
+        The session is reset when its code takes too long or uses too much memory
         """
-        starttime = datetime.datetime.now()
-        args = ' '.join([args, *leftover_args])
-        try:
-            result = eval(args)
-            if inspect.isawaitable(result):
-                result = await result
-        except SyntaxError:
-            try:
-                result = exec(args)
-            except Exception:
-                result = traceback.format_exc()
-        except Exception:
-            result = traceback.format_exc()
-        endtime = datetime.datetime.now()
-        diff = endtime - starttime
-        return await self._check_bot(message, "```python\n# Input\n{}\n# Output\n{}\n```\n:stopwatch: Time taken: `{}`".format(args, result, diff))
+        code = ' '.join([args, *leftover_args])
+        session = self.sandbox.session(self.eval_sessions.get(message.author.id, 'default'))
+        reply = None
+
+        async def progress(output):
+            nonlocal reply
+            text = self._format_eval(code, output, "running...", session.name)
+            if reply is None:
+                reply = await self._check_bot(message, text)
+            else:
+                reply = await self.safe_edit_message(reply, text)
+
+        result = await self.sandbox.run(session, code, message, progress)
+        output = result.output
+        if result.error is not None:
+            output += result.error
+        elif result.value is not None or not output:
+            output += str(result.value)
+        text = self._format_eval(code, output, datetime.timedelta(seconds=result.elapsed), session.name)
+        if reply is None:
+            return await self._check_bot(message, text)
+        return await self.safe_edit_message(reply, text)
+
+    async def cmd_session(self, message, name=None):
+        """
+        Switches to an eval session, or lists them without a name
+        Each session keeps its own variables between evaluations
+        """
+        current = self.eval_sessions.get(message.author.id, 'default')
+        if name is None:
+            if not self.sandbox.sessions:
+                return await self._check_bot(message, ":information_source: No eval sessions yet, you are using `{}`".format(current), delete_after=30)
+            response = ":information_source: Eval sessions"
+            for session in sorted(self.sandbox.sessions.values(), key=lambda s: s.name):
+                response += "\n`{}` - {} evaluations, {} variables{}".format(
+                    session.name, session.runs, session.variables, " (current)" if session.name == current else "")
+            return await self._check_bot(message, response[:MESSAGE_LIMIT])
+        if len(name) > 32:
+            return await self._check_bot(message, ":warning: Session names can be at most 32 characters", delete_after=30)
+        self.eval_sessions[message.author.id] = name
+        self.sandbox.session(name)
+        return await self._check_bot(message, ":white_check_mark: Now evaluating in session `{}`".format(name), delete_after=30)
+
+    async def cmd_endsession(self, message, name):
+        """
+        Ends an eval session, throwing away its variables
+        """
+        if not self.sandbox.remove(name):
+            return await self._check_bot(message, ":warning: There is no eval session named `{}`".format(name), delete_after=30)
+        for author, session in list(self.eval_sessions.items()):
+            if session == name:
+                del self.eval_sessions[author]
+        return await self._check_bot(message, ":white_check_mark: Ended session `{}`".format(name), delete_after=30)
 
     async def cmd_discrim(self, message, discrim):
         """
@@ -373,10 +608,11 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         For farming discriminator changes
         """
         matches = []
-        for m in self.get_all_members():
-            if m.discriminator == discrim and m != self.user:
-                if m.name not in matches:
-                    matches.append(m.name)
+        seen = set()
+        for m in self.member_index.with_discriminator(discrim):
+            if m.id != self.user.id and m.name not in seen:
+                seen.add(m.name)
+                matches.append(m.name)
         if not matches:
             return await self._check_bot(message, ":warning: No names found with discriminator **{}**".format(discrim), delete_after=30)
         matches = '`, `'.join(matches)
@@ -386,15 +622,15 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         """
         Shows information about a custom emoji
         """
-        emoji = discord.utils.get(self.get_all_emojis(), name=name)
-        if not emoji:
+        matches = self.emoji_index.get(name) or self.emoji_index.get(name, ignore_case=True)
+        if not matches:
+            similar = self.emoji_index.prefix(name, limit=20)
+            if similar:
+                similar = '`, `'.join(similar)
+                return await self._check_bot(message, ":warning: No emoji found with name **{}**. Similar emojis: `{}`".format(name, similar), delete_after=30)
             return await self._check_bot(message, ":warning: No emoji found with name **{}**".format(name), delete_after=30)
-        servers = []
-        for s in self.servers:
-            semoji = discord.utils.get(s.emojis, name=name)
-            if semoji:
-                servers.append(s.name)
-        servers = '`, `'.join(servers)
+        emoji = matches[0][1]
+        servers = '`, `'.join(s.name for s, e in matches)
         response = ":performing_arts: **{0.name}**\nServers: `{1}`\n{0.url}".format(
             emoji, servers)
         return await self._check_bot(message, response)
@@ -406,7 +642,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         time = discord.utils.snowflake_time(id)
         if not time:
             return await self._check_bot(message, ":warning: No user found with ID **{}**".format(id), delete_after=30)
-        user = discord.utils.get(self.get_all_members(), id=id)
+        user = self.member_index.get(id)
         if user:
             return await self._check_bot(message, ":snowflake: {0.name}#{0.discriminator} (**{0.id}**) was created at: `{1}`".format(user, time))
         else:
@@ -445,24 +681,18 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         content = ' '.join([content, *leftover_args])
         return await self._check_bot(message, "**{}**".format(content))
 
-    async def _check_for_key(self, data, key):
-        """
-        Checks a dictionary for a key
-        """
-        for k in data.keys():
-            if k == key:
-                return k
-        return
-
     async def cmd_tag(self, message, tag, leftover_args):
         """
         Trigger a tag
         """
         tag = ' '.join([tag, *leftover_args])
-        key = await self._check_for_key(self.tags, tag)
-        if key:
-            response = self.tags[tag]
+        response = self.store.get_tag(tag)
+        if response is not None:
             return await self._check_bot(message, response)
+        similar = self.store.search_tags(tag, limit=10)
+        if similar:
+            similar = '`, `'.join(similar)
+            return await self._check_bot(message, ":warning: No tag found: **{}**. Similar tags: `{}`".format(tag, similar), delete_after=30)
         return await self._check_bot(message, ":warning: No tag found: **{}**".format(tag), delete_after=30)
 
     @no_private
@@ -470,40 +700,84 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         """
         Reloads the bot's files
         """
+        await self.store.flush()
         self._reload()
         return await self._check_bot(message, ":package: Reloaded", delete_after=5)
 
+    async def _find_message(self, id):
+        """
+        Looks a message up in the cache, then in the archive if it's enabled
+        """
+        msg = self.message_store.get(id)
+        if msg is None and self.archive is not None:
+            msg = await self.archive.get(id)
+        return msg
+
     async def cmd_echo(self, message, id):
         """
         Tries to obtain a message via ID and send it
-        This will fail if the client receives a lot of messages
-        By default, discord.py stores 5000 messages
+        By default, the last 5000 messages seen are cached,
+        older ones can only be found when the archive is enabled
         """
-        msg = discord.utils.get(self.messages, id=id)
+        msg = await self._find_message(id)
         if not msg:
             return await self._check_bot(message, ":warning: Can't find message: **{}**".format(id), delete_after=30)
         now = datetime.datetime.utcnow()
         time = self._time_since(now, msg.timestamp)
         response = ":information_source: Posted by **{}** in <#{}> `{} ago`\n――――――――――――――――――――――――\n{}".format(
-            msg.author, msg.channel.id, time, msg.content)
+            msg.author, msg.channel_id, time, msg.content)
         return await self._check_bot(message, response)
 
+    async def cmd_search(self, message, query, leftover_args):
+        """
+        Searches the messages seen since the bot started
+        Supports "phrases", OR, NOT or -word, (groups), in:<channel>, from:<user>,
+        and before:, after: or during: followed by a date such as 2017-01-31
+        """
+        if self.search_index is None:
+            return await self._check_bot(message, ":warning: Search is disabled in the config", delete_after=30)
+        query = ' '.join([query, *leftover_args])
+        start = time.perf_counter()
+        try:
+            results = self.search_index.search(query, self.search_results + 1)
+        except QueryError as e:
+            return await self._check_bot(message, ":warning: {}".format(e.message), delete_after=30)
+        took = (time.perf_counter() - start) * 1000
+        # The command itself is indexed as well
+        results = [result for result in results if str(result[0]) != message.id][:self.search_results]
+        if not results:
+            return await self._check_bot(message, ":mag: No messages found for `{}`".format(query), delete_after=30)
+        response = ":mag: Newest messages for `{}` (took {:.1f}ms)".format(query, took)
+        for id, channel_id, author_id in results:
+            msg = await self._find_message(str(id))
+            if msg:
+                author = msg.author
+                content = msg.clean_content.replace('\n', ' ')
+            else:
+                author = author_id
+                content = "*No longer cached*"
+            if len(content) > 100:
+                content = content[:100] + "..."
+            sent = discord.utils.snowflake_time(str(id)).strftime('%Y-%m-%d %H:%M')
+            response += "\n`{}` <#{}> **{}**: {} `{}`".format(sent, channel_id, author, content, id)
+        return await self._check_bot(message, response[:MESSAGE_LIMIT])
+
     async def cmd_msginfo(self, message, id):
         """
         Tries to show different information about a message
-        This will fail if the client recieves a lot of messages
+        Older messages can only be found when the archive is enabled
         """
-        msg = discord.utils.get(self.messages, id=id)
+        msg = await self._find_message(id)
         if not msg:
             return await self._check_bot(message, ":warning: Can't find message: **{}**".format(id), delete_after=30)
-        if msg.channel.is_private:
+        if msg.is_private:
             server = "Private message"
         else:
-            server = msg.server.name
-        if not msg.channel.name:
-            channel = msg.channel.user
+            server = msg.server_name
+        if not msg.channel_name:
+            channel = msg.recipient
         else:
-            channel = "<#{}>".format(msg.channel.id)
+            channel = "<#{}>".format(msg.channel_id)
         return await self._check_bot(message, ":information_source: Here's the info on that message:\nServer: {}\nChannel: {}\nAuthor: {}\nTime sent in UTC: {}\nContent:\n{}".format(server, channel, msg.author, msg.timestamp, msg.clean_content))
 
     async def cmd_flip(self, message):
@@ -528,10 +802,9 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         """
         Removes a tag with specified name
         """
-        if name not in self.tags.keys():
+        if not self.store.has_tag(name):
             return await self._check_bot(message, ":warning: The tag **{}** doesn't exist".format(name), delete_after=30)
-        del self.tags[name]
-        self._reload(save=True)
+        await self.store.remove_tag(name)
         return await self._check_bot(message, ":white_check_mark: Removed tag **{}**".format(name))
 
     async def cmd_cleartags(self, message):
@@ -539,8 +812,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         Clears the entire list of tags
         Destructive - will not ask for confirmation
         """
-        self.tags.clear()
-        self._reload(save=True)
+        await self.store.clear_tags()
         return await self._check_bot(message, ":white_check_mark: Cleared all tags")
 
     async def safe_edit_server(self, server, **kwargs):
@@ -596,7 +868,8 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         Disables the bot temporarily
         """
         self.disabled = True
-        print(self.color + "{} disabled the bot".format(message.author))
+        self.prefilter.rebuild(self)
+        log.info("%s disabled the bot", message.author, extra=extra(self.color))
         return await self._check_bot(message, ":white_check_mark:", delete_after=5)
 
     async def cmd_enable(self, message):
@@ -604,19 +877,26 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         Re-enables the bot (when disabled)
         """
         self.disabled = False
-        print(self.color + "{} enabled the bot".format(message.author))
+        self.prefilter.rebuild(self)
+        log.info("%s enabled the bot", message.author, extra=extra(self.color))
         return await self._check_bot(message, ":white_check_mark:", delete_after=5)
 
-    async def _handle_timer(self, timer_dict):
+    async def _handle_timer(self, timer, late):
         """
         Handler for the timer command
         """
-        await asyncio.sleep(int(timer_dict['totalseconds']))
-        if timer_dict['author'] != self.user:
-            await self.safe_send_message(timer_dict['channel'], ":stopwatch: {}, your `{}:{}` timer finished".format(timer_dict['author'].mention, timer_dict['minutes'], timer_dict['seconds']))
+        channel = self.get_channel(timer.channel_id)
+        if not channel:
+            printError("Can't find channel for timer {}: {}".format(timer.id, timer.channel_id))
+            return
+        if not timer.own:
+            response = ":stopwatch: <@{}>, your `{}:{}` timer finished".format(timer.author_id, timer.minutes, timer.seconds)
         else:
-            await self.safe_send_message(timer_dict['channel'], ":stopwatch: `{}:{}` timer finished".format(timer_dict['minutes'], timer_dict['seconds']))
-        self.timers.remove(timer_dict)
+            response = ":stopwatch: `{}:{}` timer finished".format(timer.minutes, timer.seconds)
+        if late >= 60:
+            # Finished while the bot was offline
+            response += " `{} late`".format(self._time_since(datetime.timedelta(seconds=late), datetime.timedelta()))
+        await self.safe_send_message(channel, response, coalesce=True)
 
     async def cmd_timer(self, message, time):
         """
@@ -636,110 +916,209 @@ Some commands may work weird, and additionally, they can be triggered by everyon
 
         time_to_wait = datetime.timedelta(minutes=minutes, seconds=seconds)
         totalseconds = time_to_wait.total_seconds()
-        timer_dict = {'author': message.author, 'channel': message.channel, 'server': message.server,
-                      'timestamp': message.timestamp, 'minutes': minutes, 'seconds': seconds, 'totalseconds': totalseconds}
-        self.timers.append(timer_dict)
-        asyncio.ensure_future(self._handle_timer(timer_dict))
-        return await self._check_bot(message, ":white_check_mark: Timer set for **{}** minutes, **{}** seconds".format(minutes, seconds))
+        timer = self.timer_scheduler.add(totalseconds, author_id=message.author.id, author=str(message.author),
+                                         own=message.author == self.user, channel_id=message.channel.id,
+                                         channel=str(message.channel), server=str(message.server),
+                                         timestamp=str(message.timestamp), minutes=minutes, seconds=seconds)
+        return await self._check_bot(message, ":white_check_mark: Timer **{}** set for **{}** minutes, **{}** seconds".format(timer.id, minutes, seconds))
+
+    async def cmd_canceltimer(self, message, id):
+        """
+        Cancels a running timer
+        """
+        try:
+            id = int(id)
+        except ValueError:
+            return await self._check_bot(message, ":warning: **{}** could not be converted to a number".format(id), delete_after=30)
+        timer = self.timer_scheduler.get(id)
+        if not timer or (timer.author_id != message.author.id and message.author != self.user):
+            return await self._check_bot(message, ":warning: No running timer found: **{}**".format(id), delete_after=30)
+        self.timer_scheduler.cancel(id)
+        return await self._check_bot(message, ":white_check_mark: Cancelled timer **{}**".format(id))
 
     async def cmd_listtimers(self, message):
         """
-        Provides a list of all active timers
+        Provides a list of all active timers, soonest first
         """
         response = ":stopwatch: All **running** timers\n```"
-        if self.timers:
-            for t in self.timers:
-                response += "\n{} - {}:{} - {}/{} - {}".format(
-                    t['author'], t['minutes'], t['seconds'], t['server'], t['channel'], t['timestamp'])
+        timers = self.timer_scheduler.pending(limit=self.timers_per_list)
+        if timers:
+            now = datetime.datetime.utcnow()
+            for t in timers:
+                remaining = self._time_since(datetime.datetime.utcfromtimestamp(t.deadline), now)
+                response += "\n{} - {} - {}:{} - {} left - {}/{} - {}".format(
+                    t.id, t.author, t.minutes, t.seconds, remaining, t.server, t.channel, t.timestamp)
+            if len(self.timer_scheduler) > len(timers):
+                response += "\n...and {} more".format(len(self.timer_scheduler) - len(timers))
         else:
             response += "\nNone"
         response += "\n```"
         return await self._check_bot(message, response)
 
-    def _request(self, url, **kwargs):
+    async def _request(self, url, **kwargs):
         """
         Utility function for making a HTTP request to a website
         and returning the response
         """
-        r = requests.get(url, **kwargs)
+        start = time.monotonic()
+        try:
+            r = await self.http_client.get(url, **kwargs)
+        except RequestError:
+            self.metrics.record_request(api_name(url), time.monotonic() - start, error=True)
+            raise
+        self.metrics.record_request(api_name(url), time.monotonic() - start, error=r.status_code >= 400)
         return r
 
+    def _format_stats(self, stats):
+        """
+        Helper function to format the busiest commands or APIs as the rows of a table
+        """
+        if not stats:
+            return ["None\n"]
+        busiest = sorted(stats.items(), key=lambda i: i[1].count, reverse=True)[:self.stats_rows]
+        width = max(len(name) for name, stat in busiest)
+        rows = []
+        for name, stat in busiest:
+            p50, p95, p99 = (stat.latency.percentile(q) * 1000 for q in self.metrics.quantiles)
+            rows.append("{:<{}} {:>6} {:>5} {:>8.1f} {:>8.1f} {:>8.1f}\n".format(
+                name, width, stat.count, stat.errors, p50, p95, p99))
+        return rows
+
+    async def cmd_stats(self, message):
+        """
+        Shows latency and usage statistics
+        """
+        uptime = self._time_since(datetime.datetime.utcnow(), datetime.datetime.utcfromtimestamp(self.metrics.started))
+        lag = self.metrics.loop_lag
+        response = ":bar_chart: Statistics for the last `{}`\n```\n".format(uptime)
+        rows = ["Loop lag: p50 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms\n".format(
+            lag.percentile(50) * 1000, lag.percentile(99) * 1000, lag.max * 1000)]
+        for name, cache in sorted(self.metrics.caches.items()):
+            lookups = cache.hits + cache.misses
+            rate = cache.hits / lookups * 100 if lookups else 0
+            rows.append("Cache {}: {:.1f}% hit rate ({} lookups)\n".format(name, rate, lookups))
+        for host, remaining in self.http_client.open_circuits():
+            rows.append("Circuit open: {} ({:.0f}s left)\n".format(host, remaining))
+        rows.append("\nCommands (count, errors, p50/p95/p99 ms)\n")
+        rows.extend(self._format_stats(self.metrics.commands))
+        rows.append("\nAPIs (count, errors, p50/p95/p99 ms)\n")
+        rows.extend(self._format_stats(self.metrics.requests))
+        for row in rows:
+            # Leave room for the closing code block
+            if len(response) + len(row) + 3 > MESSAGE_LIMIT:
+                break
+            response += row
+        response += "```"
+        return await self._check_bot(message, response)
+
+    async def cmd_watchdog(self, message):
+        """
+        Shows the code that blocked the bot the longest
+        """
+        if not self.config.watchdog_threshold:
+            return await self._check_bot(message, ":warning: The watchdog is disabled", delete_after=30)
+        offenders = self.watchdog.top(self.config.watchdog_top)
+        if not offenders:
+            return await self._check_bot(message, ":white_check_mark: Nothing has blocked the bot for longer than {}s".format(
+                self.config.watchdog_threshold))
+        response = ":dog: Worst blocking code since startup\n```\n"
+        for offender in offenders:
+            entry = "{:.2f}s worst, {:.2f}s total, {}x at {}\n".format(
+                offender.worst, offender.total, offender.count, offender.site)
+            if offender.command:
+                entry += "    in {}\n".format(offender.command)
+            # Leave room for the closing code block
+            if len(response) + len(entry) + 3 > MESSAGE_LIMIT:
+                break
+            response += entry
+        response += "```"
+        return await self._check_bot(message, response)
+
+    async def _fetch_cat(self):
+        """
+        Gets the link to a random cat picture, used by the cat pool
+        """
+        r = await self._request(ApiBase.cat)
+        if r.status_code != 200:
+            raise RequestError("Problem getting a cat picture - {}".format(r.status_code))
+        data = r.json()
+        return data['file']
+
     async def cmd_cat(self, message):
         """
         Pastes the link to a random cat picture
         Uses random.cat API
         """
-        r = self._request(ApiBase.cat)
-        data = r.json()
-        url = data['file']
+        url = await self.pools['cat'].get()
         return await self._check_bot(message, url)
 
-    async def cmd_steamuser(self, message, steamid):
+    def _steam_connection(self):
         """
-        Get's steam user info
+        Sets up the steamapi connection once and reuses it afterwards
         """
-        steamkeyequals = "&steamids="
-        r = self._request('{}{}{}{}'.format(ApiBase.steam, self.config.steam_key, steamkeyequals, steamid))
-        steamapi.core.APIConnection(api_key=self.config.steam_key)
+        if self.steam_connection is None:
+            self.steam_connection = steamapi.core.APIConnection(api_key=self.config.steam_key)
+        return self.steam_connection
+
+    def _steam_attribute(self, user, attribute):
+        """
+        Reads a steamapi user attribute, which makes a blocking request
+        Returns None if the profile doesn't allow access to it or the request fails
+        """
+        try:
+            return getattr(user, attribute)
+        except (steamapi.errors.APIException, requests.exceptions.RequestException):
+            return None
+
+    async def _steam_user_info(self, steamid, player):
+        """
+        Builds the information shown for a single steam user
+        The steamapi requests are run concurrently in the executor
+        """
+        if not player:
+            return ":warning: No Steam user found: **{}**".format(steamid)
         user = steamapi.user.SteamUser(steamid)
-        data = r.json()
-        response = data['response']
-        players = response['players']
-        zero = players[0]
-        name = zero['personaname']
-        status = zero['personastate']
-        accountcreation = zero['timecreated']
-        lastlogoff = zero['lastlogoff']
-        recentlyplayed = user.recently_played
-        gamesnumber = len(recentlyplayed)
-        numberofbrackets = gamesnumber
-        if (user.recently_played == []):
-            recentlyplayedgame = "None"
-        if ('3' not in recentlyplayed) and ('2' not in recentlyplayed) and ('1' not in recentlyplayed) and ('0' not in recentlyplayed):
-            recentlyplayedgame = "None"
-        elif ('3' not in recentlyplayed) and ('2' not in recentlyplayed) and ('1' not in recentlyplayed):
-            for i in recentlyplayed:
-                recentlyplayedgame = "{}".format(recentlyplayed[0])
-        elif ('3' not in recentlyplayed) and ('2' not in recentlyplayed):
-            for i in recentlyplayed:
-                recentlyplayedgame = "{}, {}".format(recentlyplayed[0], recentlyplayed[1])
-        elif ('3' not in recentlyplayed):
-            for i in recentlyplayed:
-                recentlyplayedgame = "{}, {}, {}".format(recentlyplayed[0], recentlyplayed[1], recentlyplayed[2])
-        elif ('0' not in recentlyplayed):
-            recentlyplayedgame = "None"
+        recentlyplayed, level, games, friends = await asyncio.gather(*[
+            self.loop.run_in_executor(None, self._steam_attribute, user, attribute)
+            for attribute in ('recently_played', 'level', 'games', 'friends')])
+        name = player['personaname']
+        status = player['personastate']
+        accountcreation = player['timecreated']
+        lastlogoff = player['lastlogoff']
+        if recentlyplayed:
+            recentlyplayedgame = ', '.join(str(g) for g in recentlyplayed[:4])
         else:
-            for i in recentlyplayed:
-                recentlyplayedgame = "{}, {}, {}, {}".format(recentlyplayed[0], recentlyplayed[1], recentlyplayed[2], recentlyplayed[3])
-        if 'loccountrycode' not in zero:
-            countryoforigin = "Location not specified"
-        else:
-            for x in zero:
-                countryoforigin = zero['loccountrycode']
+            recentlyplayedgame = "None"
+        countryoforigin = player.get('loccountrycode', "Location not specified")
         logoffdate = date_converter.timestamp_to_string(lastlogoff, "%B %d, %Y")
         accountcreationdate = date_converter.timestamp_to_string(accountcreation, "%B %d, %Y")
-        finalresponse = "**Steam User Information** for **{}** - {}\n:desktop: **Account Created:** {}\n:level_slider: **Level:** {}\n:earth_americas: **Location:** {}".format(name, steamid, accountcreationdate, user.level, countryoforigin)
+        finalresponse = "**Steam User Information** for **{}** - {}\n:desktop: **Account Created:** {}\n:level_slider: **Level:** {}\n:earth_americas: **Location:** {}".format(name, steamid, accountcreationdate, level, countryoforigin)
         if (countryoforigin == "US"):
             finalresponse += " :flag_us:"
         elif (countryoforigin == "GB"):
             finalresponse += " :flag_gb:"
-        if (status == 0):
-            finalresponse += "\n:triangular_flag_on_post: Currently **offline** :x:"
-        if (status == 1):
-            finalresponse += "\n:triangular_flag_on_post: Currently **online** :white_check_mark:"
-        if (status == 2):
-            finalresponse += "\n:triangular_flag_on_post: Currently **busy** :no_entry:"
-        if (status == 3):
-            finalresponse += "\n:triangular_flag_on_post: Currently **away** :negative_squared_cross_mark:"
-        if (status == 4):
-            finalresponse += "\n:triangular_flag_on_post: Currently **on snooze** :zzz:"
-        if (status == 5):
-            finalresponse += "\n:triangular_flag_on_post: Currently **looking to trade** :twisted_rightwards_arrows:"
-        if (status == 6):
-            finalresponse += "\n:triangular_flag_on_post: Currently **looking to play** :video_game:"
-        finalresponse += "\n:wave: **Last Logoff:** {}\n:stopwatch: **Recently Played Games:** {}\n:video_game: **Games:** {}".format(logoffdate, recentlyplayedgame, len(user.games))
-        addresponse = "\n:busts_in_silhouette: **Friends:** {}".format(len(user.friends))
-        return await self._check_bot(message, finalresponse + addresponse)
+        if status in self.steam_statuses:
+            finalresponse += "\n:triangular_flag_on_post: Currently {}".format(self.steam_statuses[status])
+        finalresponse += "\n:wave: **Last Logoff:** {}\n:stopwatch: **Recently Played Games:** {}\n:video_game: **Games:** {}".format(
+            logoffdate, recentlyplayedgame, "Private" if games is None else len(games))
+        addresponse = "\n:busts_in_silhouette: **Friends:** {}".format("Private" if friends is None else len(friends))
+        return finalresponse + addresponse
+
+    async def cmd_steamuser(self, message, steamid, leftover_args):
+        """
+        Get's steam user info
+        Takes one or more steam IDs
+        """
+        steamids = [steamid, *leftover_args]
+        steamkeyequals = "&steamids="
+        r = await self._request('{}{}{}{}'.format(ApiBase.steam, self.config.steam_key, steamkeyequals, ','.join(steamids)))
+        if r.status_code != 200:
+            return await self._check_bot(message, ":warning: Problem getting Steam users - {}".format(r.status_code), delete_after=30)
+        data = r.json()
+        players = {p['steamid']: p for p in data['response']['players']}
+        self._steam_connection()
+        responses = await asyncio.gather(*[self._steam_user_info(i, players.get(i)) for i in steamids])
+        return await self._check_bot(message, '\n\n'.join(responses))
 
     async def cmd_holidays(self, message, country=None):
         """
@@ -757,7 +1136,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
                 return await self._check_bot(message, ":warning: Invalid country. Valid countries are: `{}`".format(valid), delete_after=30)
         else:
             country = self.config.holidays_country
-        r = self._request('{}?country={}&year={}&month={}&day={}&upcoming=True&key={}'.format(
+        r = await self._request('{}?country={}&year={}&month={}&day={}&upcoming=True&key={}'.format(
             ApiBase.holidays, country, now.year, now.month, now.day, self.config.holidays_key))
         if r.status_code != 200:
             printError(
@@ -801,21 +1180,24 @@ Some commands may work weird, and additionally, they can be triggered by everyon
                 response += "`{}`".format(channel_list)
         return await self._check_bot(message, response)
 
-    async def cmd_tags(self, message):
+    async def cmd_tags(self, message, page=1):
         """
-        Returns a list of all tags that have been set up
+        Returns a page of all tags that have been set up
         """
-        if not self.tags:
+        count = self.store.tag_count()
+        if not count:
             return await self._check_bot(message, ":warning: No tags have been setup", delete_after=30)
-        response = ":information_source: List of **tags**"
-        if not self.tags.keys():
-            response += "\nNone"
-        else:
-            tags = []
-            for i in self.tags.keys():
-                tags.append(i)
-            tags = '`, `'.join(tags)
-            response += "\n`{}`".format(tags)
+        try:
+            page = int(page)
+        except ValueError:
+            return await self._check_bot(message, ":warning: **{}** could not be converted to a number".format(page), delete_after=30)
+        pages = (count + self.tags_per_page - 1) // self.tags_per_page
+        if not 1 <= page <= pages:
+            return await self._check_bot(message, ":warning: Page must be between **1** and **{}**".format(pages), delete_after=30)
+        tags = self.store.tag_names(offset=(page - 1) * self.tags_per_page, limit=self.tags_per_page)
+        response = ":information_source: List of **tags** (page {}/{})".format(page, pages)
+        tags = '`, `'.join(tags)
+        response += "\n`{}`".format(tags)
         return await self._check_bot(message, response)
 
     async def cmd_addtag(self, message, name, leftover_args):
@@ -825,10 +1207,9 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         if not leftover_args:
             return await self._check_bot(message, ":warning: You must specify content for your tag **{}**".format(name))
         content = ' '.join([*leftover_args])
-        if name in self.tags.keys():
+        if self.store.has_tag(name):
             return await self._check_bot(message, ":warning: A tag with the name **{}** already exists".format(name), delete_after=30)
-        self.tags[name] = content
-        self._reload(save=True)
+        await self.store.add_tag(name, content)
         return await self._check_bot(message, ":white_check_mark: Added tag **{}**".format(name))
 
     async def cmd_githubuser(self, message, name):
@@ -836,7 +1217,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         Get information about a GitHub user
         Uses the GitHub API v3
         """
-        r = self._request('{}users/{}'.format(ApiBase.github, name))
+        r = await self._request('{}users/{}'.format(ApiBase.github, name))
         if r.status_code != 200:
             return await self._check_bot(message, ":warning: Problem getting GitHub info for **{}**: `{}`".format(name, r.status_code))
         data = r.json()
@@ -855,9 +1236,11 @@ Some commands may work weird, and additionally, they can be triggered by everyon
             if gender not in self.name_genders:
                 return await self._check_bot(message, ":warning: Invalid gender")
         if gender:
-            r = self._request('{}?gender={}'.format(ApiBase.names, gender))
+            r = await self._request('{}?gender={}'.format(ApiBase.names, gender))
         else:
-            r = self._request(ApiBase.names)
+            r = await self._request(ApiBase.names)
+        if r.status_code != 200:
+            return await self._check_bot(message, ":warning: Problem generating a name - {}".format(r.status_code), delete_after=30)
         data = r.json()
 
         response = "**{} {}** - Gender: `{}` - Region: `{}`".format(
@@ -870,36 +1253,59 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         Returns information about the current version of Hearthstone
         """
         message = await self._check_bot(message, ":black_joker: Getting information...")
-        r = self._request(
-            '{}/info'.format(ApiBase.hearthstone), headers=self.mashape_headers)
-        if r.status_code != 200:
-            return await self._check_bot(message, ":warning: Invalid Mashape API key(?) - {}".format(r.status_code), delete_after=30)
-        data = r.json()
+        # The card dump is several MB, so it isn't cached with the other responses
+        # It's requested alongside the info and only read and counted (in the executor)
+        # when the patch changed, otherwise the request is cancelled
+        cards_request = asyncio.ensure_future(self._request('{}/cards'.format(ApiBase.hearthstone),
+                                                            headers=self.mashape_headers, cache=False))
+        try:
+            r = await self._request('{}/info'.format(ApiBase.hearthstone), headers=self.mashape_headers)
+            if r.status_code != 200:
+                return await self._check_bot(message, ":warning: Invalid Mashape API key(?) - {}".format(r.status_code), delete_after=30)
+            data = r.json()
+            if self.hearthstone_cards[0] != data['patch']:
+                r2 = await cards_request
+                if r2.status_code != 200:
+                    return await self._check_bot(message, ":warning: Problem getting Hearthstone cards - {}".format(r2.status_code), delete_after=30)
+                cards = await self.loop.run_in_executor(None, count_list_entries, r2.content)
+                self.hearthstone_cards = (data['patch'], cards)
+        finally:
+            if not cards_request.done():
+                cards_request.cancel()
+            elif not cards_request.cancelled():
+                cards_request.exception()  # Retrieved so an unused failure isn't logged
         response = ":black_joker: Information about Hearthstone\nCurrent patch: `{}`\n".format(
             data['patch'])
-        r = self._request(
-            '{}/cards'.format(ApiBase.hearthstone), headers=self.mashape_headers)
-        data2 = r.json()
-        cards = 0
-        for t in data2:
-            cards += len(data2[t])
+        cards = self.hearthstone_cards[1]
         response += "Total cards: `{}`\nTotal classes: `{}`\nTotal sets: `{}`\nTotal types: `{}`\nTotal factions: `{}`\nTotal races: `{}`".format(
             cards, len(data['classes']), len(data['sets']), len(data['types']), len(data['factions']), len(data['races']))
         return await self._check_bot(message, response)
         
-    @mashape
-    async def cmd_quote(self, message):
-        r = self._request('{}'.format(ApiBase.quote), headers=self.mashape_headers)
+    async def _fetch_quote(self):
+        """
+        Gets a random famous quote, used by the quote pool
+        """
+        r = await self._request('{}'.format(ApiBase.quote), headers=self.mashape_headers)
         if r.status_code != 200:
-            return await self._check_bot(message, ":warning: Invalid Mashape API key(?) - {}".format(r.status_code), delete_after=30)
+            raise RequestError("Invalid Mashape API key(?) - {}".format(r.status_code))
         data = r.json()
         response = "**__Famous Quote__**\n\"{}\"".format(data['quote'])
         response += "\nBy: **{}** :microphone2:".format(data['author'])
+        return response
+
+    @mashape
+    async def cmd_quote(self, message):
+        response = await self.pools['quote'].get()
         return await self._check_bot(message, response)
         
     async def cmd_weather(self, message, zipcode):
-        r = self._request('{}{}{}{}{}'.format(ApiBase.weather, self.config.weather_key, "/conditions/q/", zipcode, ".json"))
+        r = await self._request('{}{}{}{}{}'.format(ApiBase.weather, self.config.weather_key, "/conditions/q/", zipcode, ".json"))
+        if r.status_code != 200:
+            return await self._check_bot(message, ":warning: Problem getting the weather - {}".format(r.status_code), delete_after=30)
         data = r.json()
+        if "current_observation" not in data:
+            # Unknown places and invalid keys are reported in the body
+            return await self._check_bot(message, ":warning: No weather found for **{}**".format(zipcode), delete_after=30)
         current = data["current_observation"]
         location = current["display_location"]
         full = location["full"]
@@ -944,7 +1350,7 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         if '#' not in battletag:
             return await self._check_bot(message, ":warning: That is not a valid battletag", delete_after=30)
         battletag = battletag.replace('#', '-')
-        r = self._request(
+        r = await self._request(
             '{}{}/stats/general'.format(ApiBase.overwatch, battletag))
         if r.status_code != 200:
             return await self._check_bot(message, ":warning: Error getting information - {}".format(r.status_code), delete_after=30)
@@ -977,21 +1383,37 @@ Some commands may work weird, and additionally, they can be triggered by everyon
         date2 = datetime.date.today().strftime('%m/%d/%Y')
         return await self._check_bot(message, ":calendar_spiral: Today's date is **{}** or **{}**".format(date, date2))
 
-    async def cmd_joke(self, message):
-        r = self._request('{}'.format(ApiBase.joke))
+    async def _fetch_joke(self):
+        """
+        Gets a random joke, used by the joke pool
+        """
+        r = await self._request('{}'.format(ApiBase.joke))
+        if r.status_code != 200:
+            raise RequestError("Problem getting a joke - {}".format(r.status_code))
         data = r.json()
-        response = "**{}** :tada:".format(data['joke'])
+        return "**{}** :tada:".format(data['joke'])
+
+    async def cmd_joke(self, message):
+        response = await self.pools['joke'].get()
         return await self._check_bot(message, response)
 
-    async def cmd_yomama(self, message):
-        r = self._request('{}'.format(ApiBase.yomama))
+    async def _fetch_yomama(self):
+        """
+        Gets a random yomama joke, used by the yomama pool
+        """
+        r = await self._request('{}'.format(ApiBase.yomama))
+        if r.status_code != 200:
+            raise RequestError("Problem getting a yomama joke - {}".format(r.status_code))
         data = r.json()
-        response = "**\"{}\"** :person_frowning:".format(data['joke'])
+        return "**\"{}\"** :person_frowning:".format(data['joke'])
+
+    async def cmd_yomama(self, message):
+        response = await self.pools['yomama'].get()
         return await self._check_bot(message, response)
 
     @mashape
     async def cmd_urbandictionary(self, message, word):
-        r = self._request('{}{}'.format(ApiBase.urbandictionary, word), headers=self.mashape_headers)
+        r = await self._request('{}{}'.format(ApiBase.urbandictionary, word), headers=self.mashape_headers)
         if r.status_code != 200:
             return await self._check_bot(message, ":warning: Invalid Mashape API key(?) - {}".format(r.status_code), delete_after=30)
         data = r.json()
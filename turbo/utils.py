@@ -1,3 +1,5 @@
+import json
+
 from .exceptions import printError
 
 VERSION = "2.0_nightly_130816"
@@ -21,6 +23,17 @@ def load_file(filename, skip_commented_lines=True, comment_char='#'):
         return []
 
 
+def count_list_entries(content):
+    """
+    Counts the entries of every list in a UTF-8 encoded JSON object of lists
+    Objects are collapsed into numbers as soon as they're parsed,
+    so the whole document is never held in memory at once
+    """
+    def collapse(pairs):
+        return sum(len(v) for k, v in pairs if isinstance(v, list))
+    return json.loads(content.decode('utf-8', errors='replace'), object_pairs_hook=collapse)
+
+
 class ApiBase:
     cat = "http://random.cat/meow"
     holidays = "https://holidayapi.com/v1/holidays"
@@ -0,0 +1,130 @@
+import logging
+import os
+import reprlib
+import sys
+import threading
+import time
+import traceback
+
+log = logging.getLogger('turbo.watchdog')
+
+_PACKAGE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Offender:
+    """
+    A place that blocked the event loop, and how badly it did
+    """
+    __slots__ = ('site', 'command', 'count', 'total', 'worst', 'stack')
+
+    def __init__(self, site, command):
+        self.site = site
+        self.command = command
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack = None
+
+
+class Watchdog:
+    """
+    Watches the event loop from a separate thread
+    When the loop stops responding for longer than the threshold,
+    the stack of its thread is captured to find what is blocking it
+    """
+
+    def __init__(self, loop, threshold=0.5, interval=0.1, tracked=100):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.tracked = tracked
+        self.offenders = {}
+        self._heartbeat = time.monotonic()
+        self._handle = None
+        self._thread = None
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts watching, has to be called from the event loop's thread
+        """
+        if self._thread is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name='turbo-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._handle.cancel()
+        self._thread = None
+
+    def top(self, amount):
+        """
+        Returns the worst offenders, worst first
+        """
+        with self._lock:
+            return sorted(self.offenders.values(), key=lambda o: o.worst, reverse=True)[:amount]
+
+    def _beat(self):
+        self._heartbeat = time.monotonic()
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        stall = None
+        while not self._stopped.wait(self.interval):
+            beat = self._heartbeat
+            if stall is not None and beat != stall[0]:
+                # The loop is running again
+                self._report(beat - stall[0] - self.interval, *stall[1:])
+                stall = None
+            if stall is None and time.monotonic() - beat - self.interval > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    stall = (beat,) + self._describe(frame)
+
+    def _describe(self, frame):
+        """
+        Finds the innermost line of Turbo's code and the command running in a stack
+        """
+        stack = traceback.extract_stack(frame)
+        site = None
+        command = None
+        f = frame
+        while f is not None:
+            code = f.f_code
+            if site is None and code.co_filename.startswith(_PACKAGE):
+                site = "{}:{} in {}".format(os.path.basename(code.co_filename), f.f_lineno, code.co_name)
+            if command is None and code.co_name.startswith('cmd_'):
+                args = {k: v for k, v in f.f_locals.items()
+                        if k not in ('self', 'message') and k in code.co_varnames[:code.co_argcount]}
+                command = "{}({})".format(code.co_name, ', '.join(
+                    "{}={}".format(k, reprlib.repr(v)) for k, v in sorted(args.items())))
+            f = f.f_back
+        if site is None:
+            last = stack[-1]
+            site = "{}:{} in {}".format(os.path.basename(last[0]), last[1], last[2])
+        return site, command, ''.join(traceback.format_list(stack[-10:]))
+
+    def _report(self, duration, site, command, stack):
+        log.warning("Event loop was blocked for %.2fs at %s%s\n%s", duration, site,
+                    " while running {}".format(command) if command else "", stack.rstrip())
+        with self._lock:
+            offender = self.offenders.get(site)
+            if offender is None:
+                if len(self.offenders) >= self.tracked:
+                    mildest = min(self.offenders.values(), key=lambda o: o.worst)
+                    del self.offenders[mildest.site]
+                offender = self.offenders[site] = Offender(site, command)
+            offender.count += 1
+            offender.total += duration
+            if duration >= offender.worst:
+                offender.worst = duration
+                offender.command = command
+                offender.stack = stack